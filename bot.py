@@ -22,7 +22,7 @@ async def init_db():
     # Создаем директорию для базы данных, если она не существует
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-    logger.info(f"Initializing database at {DB_PATH}")
+    logger.info("Initializing database at %s", DB_PATH)
 
     # Инициализация репозиториев
     user_repository = UserRepository(DB_PATH)
@@ -51,7 +51,7 @@ async def main():
     bot, dp = create_bot(settings, user_repository, chat_repository)
 
     # Логируем для отладки
-    logger.info(f"Using custom Telegram API URL: {settings.TELEGRAM_API_URL}")
+    logger.info("Using custom Telegram API URL: %s", settings.TELEGRAM_API_URL)
     logger.info("Bot started, polling for updates...")
 
     # Запускаем polling
@@ -64,4 +64,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Bot stopped due to error: {e}", exc_info=True)
\ No newline at end of file
+        logger.error("Bot stopped due to error: %s", e, exc_info=True)
\ No newline at end of file
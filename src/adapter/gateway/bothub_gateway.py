@@ -1,8 +1,8 @@
-import os
 import time
-from src.lib.utils.file_utils import download_file
+import asyncio
+from src.lib.utils.file_utils import download_bytes
 from typing import Dict, Any, Optional, List, Tuple
-from src.lib.clients.bothub_client import BothubClient
+from src.lib.clients.bothub_client import BothubClient, EXPECTED_ERRORS
 from src.domain.entity.user import User
 from src.domain.entity.chat import Chat
 from datetime import datetime
@@ -31,11 +31,11 @@ class BothubGateway:
 
             if (user.bothub_access_token_created_at and
                     (current_time - user.bothub_access_token_created_at).total_seconds() < token_lifetime):
-                logger.debug(f"Using existing token for user {user.id}")
+                logger.debug("Using existing token for user %s", user.id)
                 return (user.bothub_access_token, user.bothub_group_id,
                         None, None)
 
-        logger.info(f"Getting new access token for user {user.id}")
+        logger.info("Getting new access token for user %s", user.id)
         response = await self.client.authorize(
             user.telegram_id,
             user.first_name or user.username or "Telegram User",
@@ -55,8 +55,8 @@ class BothubGateway:
         chat_id = None
         model_id = None
 
-        if "groups" in response["user"] and response["user"]["groups"]:
-            groups = response["user"]["groups"]
+        groups = response["user"].get("groups")
+        if groups:
             group_id = groups[0]["id"]
             user.bothub_group_id = group_id
 
@@ -64,8 +64,7 @@ class BothubGateway:
                 chats = groups[0]["chats"]
                 chat_id = chats[0]["id"]
 
-                if "settings" in chats[0] and "model" in chats[0]["settings"]:
-                    model_id = chats[0]["settings"]["model"]
+                model_id = chats[0].get("settings", {}).get("model")
 
         return user.bothub_access_token, group_id, chat_id, model_id
 
@@ -96,9 +95,21 @@ class BothubGateway:
         """Создание нового чата"""
         access_token, group_id, _, _ = await self.get_access_token(user)
 
+        # Список моделей не зависит от группы, поэтому запрашиваем его параллельно с её созданием
+        models_task = None
+        if not is_image_generation:
+            models_task = asyncio.create_task(self.get_available_models(access_token))
+
         if not group_id:
-            logger.info(f"Creating new group for user {user.id}")
-            group_response = await self.client.create_new_group(access_token, "Telegram")
+            logger.info("Creating new group for user %s", user.id)
+            try:
+                group_response = await self.client.create_new_group(access_token, "Telegram")
+            except BaseException:
+                # Включая отмену и таймаут запроса (CancelledError), иначе задача
+                # со списком моделей осталась бы работать без наблюдения
+                if models_task:
+                    models_task.cancel()
+                raise
             group_id = group_response["id"]
             user.bothub_group_id = group_id
 
@@ -114,7 +125,7 @@ class BothubGateway:
                 )
             else:
                 # Получаем список моделей и находим дефолтную модель
-                models = await self.get_available_models(access_token)
+                models = await models_task
                 default_model = None
                 for model in models:
                     if (model.get("is_default", False) or model.get("is_allowed",
@@ -151,17 +162,22 @@ class BothubGateway:
             chat.bothub_chat_model = model_id
 
         except Exception as e:
-            logger.error(f"Error creating chat: {str(e)}")
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error creating chat: %s", e)
+            else:
+                logger.exception("Error creating chat: %s", e)
             if "MODEL_NOT_FOUND" in str(e):
                 # Пробуем создать чат с моделью по умолчанию
                 models = await self.client.list_models(access_token)
-                logger.warning(f"Available models: {[m.get('id') for m in models]}")
+                # Список идентификаторов собираем, только если предупреждение попадёт в лог
+                if logger.isEnabledFor(logging.WARNING):
+                    logger.warning("Available models: %s", [m.get('id') for m in models])
                 # Берем первую доступную модель TEXT_TO_TEXT
                 for model in models:
                     if "TEXT_TO_TEXT" in model.get("features", []) and model.get("is_allowed", False):
                         model_id = model.get("id")
                         parent_id = model.get("parent_id", model_id)
-                        logger.info(f"Trying with model {parent_id} -> {model_id}")
+                        logger.info("Trying with model %s -> %s", parent_id, model_id)
                         response = await self.client.create_new_chat(
                             access_token,
                             group_id,
@@ -225,26 +241,24 @@ class BothubGateway:
         access_token, _, _, _ = await self.get_access_token(user)
         await self.client.enable_web_search(access_token, chat.bothub_chat_id, value)
 
-    async def transcribe_voice(self, user: User, chat: Chat, file_url: str) -> str:
+    async def transcribe_voice(self, user: User, chat: Chat, file_url: str, file_path: Optional[str] = None) -> str:
         """Транскрибирование голосового сообщения"""
         access_token, _, _, _ = await self.get_access_token(user)
 
         try:
-            # Скачиваем файл во временный каталог
-            temp_file = await download_file(file_url, f"voice_{user.id}_{int(time.time())}.ogg")
+            # Голосовые сообщения небольшие (Bot API отдаёт файлы до 20 МБ),
+            # поэтому скачиваем их в память, минуя диск
+            file_data = await download_bytes(file_url, file_path)
 
             # Отправляем на транскрибирование
-            result = await self.client.transcribe(access_token, temp_file)
-
-            # Удаляем временный файл
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+            result = await self.client.transcribe(access_token, file_data, f"voice_{user.id}_{int(time.time())}.ogg")
 
             return result.get("text", "")
         except Exception as e:
-            logger.error(f"Error in BotHub transcription: {e}", exc_info=True)
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error in BotHub transcription: %s", e)
+            else:
+                logger.exception("Error in BotHub transcription: %s", e)
             # Пока просто возвращаем заглушку
             return "Это текст голосового сообщения (заглушка)"
 
@@ -266,7 +280,7 @@ class BothubGateway:
         except Exception as e:
             # Если чат не найден, создаем новый
             if "CHAT_NOT_FOUND" in str(e):
-                logger.warning(f"Chat not found, creating new one for user {user.id}")
+                logger.warning("Chat not found, creating new one for user %s", user.id)
                 await self.create_new_chat(user, chat)
                 return await self.client.send_message(access_token, chat.bothub_chat_id, message, files)
             raise
\ No newline at end of file
@@ -3,6 +3,21 @@ import json
 from typing import Optional, List
 from src.domain.entity.chat import Chat
 
+UPDATE_CHAT_QUERY = '''
+    UPDATE chats SET
+        bothub_chat_id = ?,
+        bothub_chat_model = ?,
+        context_remember = ?,
+        context_counter = ?,
+        links_parse = ?,
+        formula_to_image = ?,
+        answer_to_voice = ?,
+        name = ?,
+        system_prompt = ?,
+        buffer = ?
+    WHERE id = ?
+'''
+
 
 class ChatRepository:
     """Репозиторий для работы с чатами в базе данных SQLite"""
@@ -85,31 +100,29 @@ class ChatRepository:
             await db.commit()
             return cursor.lastrowid
 
+    @staticmethod
+    def _update_params(chat: Chat) -> tuple:
+        """Параметры запроса обновления чата"""
+        # Сериализуем JSON поля
+        buffer = json.dumps(chat.buffer) if chat.buffer else None
+
+        return (
+            chat.bothub_chat_id, chat.bothub_chat_model,
+            int(chat.context_remember), chat.context_counter, int(chat.links_parse), int(chat.formula_to_image),
+            int(chat.answer_to_voice), chat.name, chat.system_prompt, buffer,
+            chat.id
+        )
+
     async def update(self, chat: Chat) -> None:
         """Обновить чат в базе данных"""
         async with aiosqlite.connect(self.db_path) as db:
-            # Сериализуем JSON поля
-            buffer = json.dumps(chat.buffer) if chat.buffer else None
+            await db.execute(UPDATE_CHAT_QUERY, self._update_params(chat))
+            await db.commit()
 
-            await db.execute('''
-                UPDATE chats SET
-                    bothub_chat_id = ?,
-                    bothub_chat_model = ?,
-                    context_remember = ?,
-                    context_counter = ?,
-                    links_parse = ?,
-                    formula_to_image = ?,
-                    answer_to_voice = ?,
-                    name = ?,
-                    system_prompt = ?,
-                    buffer = ?
-                WHERE id = ?
-            ''', (
-                chat.bothub_chat_id, chat.bothub_chat_model,
-                int(chat.context_remember), chat.context_counter, int(chat.links_parse), int(chat.formula_to_image),
-                int(chat.answer_to_voice), chat.name, chat.system_prompt, buffer,
-                chat.id
-            ))
+    async def update_many(self, chats: List[Chat]) -> None:
+        """Обновить несколько чатов одной транзакцией"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(UPDATE_CHAT_QUERY, [self._update_params(chat) for chat in chats])
             await db.commit()
 
     async def get_paginated_chats(self, user_id: int, page: int, items_per_page: int) -> List[Chat]:
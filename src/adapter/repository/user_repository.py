@@ -9,6 +9,33 @@ from src.domain.entity.user import User
 
 logger = logging.getLogger(__name__)
 
+UPDATE_USER_QUERY = '''
+    UPDATE users SET
+        first_name = ?,
+        last_name = ?,
+        username = ?,
+        language_code = ?,
+        bothub_id = ?,
+        bothub_group_id = ?,
+        bothub_access_token = ?,
+        bothub_access_token_created_at = ?,
+        current_chat_index = ?,
+        current_chat_list_page = ?,
+        gpt_model = ?,
+        image_generation_model = ?,
+        formula_to_image = ?,
+        links_parse = ?,
+        context_remember = ?,
+        answer_to_voice = ?,
+        state = ?,
+        present_data = ?,
+        referral_code = ?,
+        buffer = ?,
+        system_messages_to_delete = ?
+    WHERE id = ?
+'''
+
+
 class UserRepository:
     """Репозиторий для работы с пользователями в базе данных SQLite"""
 
@@ -171,49 +198,45 @@ class UserRepository:
             await db.commit()
             return cursor.lastrowid
 
+    @staticmethod
+    def _update_params(user: User) -> tuple:
+        """Параметры запроса обновления пользователя"""
+        # Сериализуем JSON поля
+        buffer = json.dumps(user.buffer) if user.buffer else None
+        system_messages_to_delete = json.dumps(user.system_messages_to_delete) if user.system_messages_to_delete else None
+
+        # Сериализуем datetime
+        bothub_access_token_created_at = user.bothub_access_token_created_at.isoformat() if user.bothub_access_token_created_at else None
+
+        return (
+            user.first_name, user.last_name, user.username, user.language_code,
+            user.bothub_id, user.bothub_group_id, user.bothub_access_token, bothub_access_token_created_at,
+            user.current_chat_index, user.current_chat_list_page, user.gpt_model, user.image_generation_model,
+            int(user.formula_to_image), int(user.links_parse), int(user.context_remember),
+            int(user.answer_to_voice),
+            user.state, user.present_data, user.referral_code, buffer, system_messages_to_delete,
+            user.id
+        )
+
     async def update(self, user: User) -> None:
         """Обновить пользователя в базе данных"""
         async with aiosqlite.connect(self.db_path) as db:
-            # Сериализуем JSON поля
-            buffer = json.dumps(user.buffer) if user.buffer else None
-            system_messages_to_delete = json.dumps(user.system_messages_to_delete) if user.system_messages_to_delete else None
+            await db.execute(UPDATE_USER_QUERY, self._update_params(user))
+            await db.commit()
 
-            # Сериализуем datetime
-            bothub_access_token_created_at = user.bothub_access_token_created_at.isoformat() if user.bothub_access_token_created_at else None
+    async def update_many(self, users: List[User]) -> None:
+        """Обновить нескольких пользователей одной транзакцией"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(UPDATE_USER_QUERY, [self._update_params(user) for user in users])
+            await db.commit()
 
-            await db.execute('''
-                UPDATE users SET
-                    first_name = ?,
-                    last_name = ?,
-                    username = ?,
-                    language_code = ?,
-                    bothub_id = ?,
-                    bothub_group_id = ?,
-                    bothub_access_token = ?,
-                    bothub_access_token_created_at = ?,
-                    current_chat_index = ?,
-                    current_chat_list_page = ?,
-                    gpt_model = ?,
-                    image_generation_model = ?,
-                    formula_to_image = ?,
-                    links_parse = ?,
-                    context_remember = ?,
-                    answer_to_voice = ?,
-                    state = ?,
-                    present_data = ?,
-                    referral_code = ?,
-                    buffer = ?,
-                    system_messages_to_delete = ?
-                WHERE id = ?
-            ''', (
-                user.first_name, user.last_name, user.username, user.language_code,
-                user.bothub_id, user.bothub_group_id, user.bothub_access_token, bothub_access_token_created_at,
-                user.current_chat_index, user.current_chat_list_page, user.gpt_model, user.image_generation_model,
-                int(user.formula_to_image), int(user.links_parse), int(user.context_remember),
-                int(user.answer_to_voice),
-                user.state, user.present_data, user.referral_code, buffer, system_messages_to_delete,
-                user.id
-            ))
+    async def update_referral_code(self, user_id: int, referral_code: Optional[str]) -> None:
+        """Обновить только реферальный код пользователя"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "UPDATE users SET referral_code = ? WHERE id = ?",
+                (referral_code, user_id)
+            )
             await db.commit()
 
     async def get_all(self, limit: int = 100, offset: int = 0) -> List[User]:
@@ -21,6 +21,17 @@ class Settings(BaseSettings):
     # Настройки приложения
     DEBUG: bool = False
 
+    # Кэш пользователей и чатов в памяти бота
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_TTL: float = 300.0
+    USER_CACHE_MAX_SIZE: int = 10_000
+
+    # Пул HTTP-соединений к BotHub API и хранилищу файлов
+    HTTP_POOL_LIMIT: int = 128
+    HTTP_POOL_LIMIT_PER_HOST: int = 32
+    HTTP_DNS_CACHE_TTL: int = 600
+    HTTP_KEEPALIVE_TIMEOUT: float = 75.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -20,7 +20,7 @@ async def init_db():
     # Создаем директорию для базы данных, если она не существует
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-    logger.info(f"Initializing database at {DB_PATH}")
+    logger.info("Initializing database at %s", DB_PATH)
 
     # Инициализация репозиториев
     user_repository = UserRepository(DB_PATH)
@@ -45,7 +45,7 @@ def create_app():
 
             return {"status": "ok"}
         except Exception as e:
-            logger.error(f"Error processing webhook: {e}", exc_info=True)
+            logger.error("Error processing webhook: %s", e, exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
 
     @app.get("/health")
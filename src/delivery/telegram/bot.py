@@ -5,6 +5,7 @@ from aiogram.client.telegram import TelegramAPIServer
 from aiogram.client.default import DefaultBotProperties
 from src.config.settings import Settings
 from src.delivery.telegram.handlers import create_handlers
+from src.delivery.telegram.rate_limiter import TelegramRateLimiter
 from src.domain.service.intent_detection import IntentDetectionService
 from src.domain.usecase.chat_session import ChatSessionUseCase
 from src.domain.usecase.web_search import WebSearchUseCase
@@ -13,15 +14,22 @@ from src.lib.clients.bothub_client import BothubClient
 from src.adapter.gateway.bothub_gateway import BothubGateway
 from src.adapter.repository.user_repository import UserRepository
 from src.adapter.repository.chat_repository import ChatRepository
+from src.lib.utils.file_utils import close_session, configure_session
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Путь к временной базе данных, если репозитории не переданы
+TEMP_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../data/temp.db')
+
 
 def create_bot(settings: Settings, user_repository=None, chat_repository=None) -> tuple[Bot, Dispatcher]:
     """Фабричный метод для создания бота и диспетчера"""
     # Создаём сессию с кастомным API URL
     session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+    # Все исходящие запросы к Telegram проходят через общий ограничитель частоты
+    session.middleware(TelegramRateLimiter())
 
     # Инициализируем бота
     bot = Bot(
@@ -35,6 +43,12 @@ def create_bot(settings: Settings, user_repository=None, chat_repository=None) -
 
     # Инициализация клиентов
     bothub_client = BothubClient(settings)
+    configure_session(
+        limit=settings.HTTP_POOL_LIMIT,
+        limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT
+    )
 
     # Инициализация адаптеров
     bothub_gateway = BothubGateway(bothub_client)
@@ -42,17 +56,13 @@ def create_bot(settings: Settings, user_repository=None, chat_repository=None) -
     # Используем переданные репозитории или создаем пустые заглушки
     if user_repository is None:
         # Здесь была ошибка: вместо MockUserRepository используем просто заглушку
-        import os
-        temp_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../data/temp.db')
-        os.makedirs(os.path.dirname(temp_db_path), exist_ok=True)
-        user_repository = UserRepository(temp_db_path)
+        os.makedirs(os.path.dirname(TEMP_DB_PATH), exist_ok=True)
+        user_repository = UserRepository(TEMP_DB_PATH)
 
     if chat_repository is None:
         # Здесь была ошибка: вместо MockChatRepository используем просто заглушку
-        import os
-        temp_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../data/temp.db')
-        os.makedirs(os.path.dirname(temp_db_path), exist_ok=True)
-        chat_repository = ChatRepository(temp_db_path)
+        os.makedirs(os.path.dirname(TEMP_DB_PATH), exist_ok=True)
+        chat_repository = ChatRepository(TEMP_DB_PATH)
 
     # Инициализация сервисов
     intent_detection_service = IntentDetectionService()
@@ -69,12 +79,21 @@ def create_bot(settings: Settings, user_repository=None, chat_repository=None) -
         image_generation_usecase=image_generation_usecase,
         intent_detection_service=intent_detection_service,
         user_repository=user_repository,
-        chat_repository=chat_repository
+        chat_repository=chat_repository,
+        cache_ttl=settings.USER_CACHE_TTL if settings.USER_CACHE_ENABLED else 0,
+        cache_max_size=settings.USER_CACHE_MAX_SIZE
     )
 
     # Подключаем обработчики к диспетчеру
     dp.include_router(handlers_dp)
 
-    logger.info(f"Bot created with custom Telegram API URL: {settings.TELEGRAM_API_URL}")
+    async def on_shutdown():
+        """Закрывает общие HTTP-сессии при остановке бота"""
+        await bothub_client.close()
+        await close_session()
+
+    dp.shutdown.register(on_shutdown)
+
+    logger.info("Bot created with custom Telegram API URL: %s", settings.TELEGRAM_API_URL)
 
     return bot, dp
\ No newline at end of file
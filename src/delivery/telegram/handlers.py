@@ -1,7 +1,11 @@
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import BufferedInputFile, ErrorEvent, InputMediaPhoto, Message
 from aiogram.enums.chat_action import ChatAction
+from aiogram.enums.content_type import ContentType
+from aiogram.utils.chat_action import ChatActionSender
+from aiogram.utils.formatting import Bold, Italic, Text
 from src.domain.service.intent_detection import IntentDetectionService, IntentType
 from src.domain.usecase.chat_session import ChatSessionUseCase
 from src.domain.usecase.web_search import WebSearchUseCase
@@ -10,29 +14,542 @@ from src.domain.entity.user import User
 from src.domain.entity.chat import Chat
 from src.adapter.repository.user_repository import UserRepository
 from src.adapter.repository.chat_repository import ChatRepository
+from src.lib.clients.bothub_client import EXPECTED_ERRORS
+from src.lib.utils.file_utils import download_bytes
+import asyncio
 import logging
+import os
 import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import astuple
+from operator import attrgetter
+from typing import Any, Awaitable, Coroutine, Dict, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Ограничение числа одновременных запросов к BotHub API
+_BOTHUB_SEMAPHORE = asyncio.Semaphore(32)
+
+# Сколько секунд ждать ответа BotHub (вместе с созданием чата и повторными попытками)
+BOTHUB_REQUEST_TIMEOUT = 120
+
+# Сколько запросов к BotHub может выполняться и ждать очереди одновременно;
+# сообщения сверх этого сразу получают ответ о перегрузке
+BOTHUB_QUEUE_LIMIT = 200
+_bothub_requests = 0
+
+# Отдельное ограничение для загрузки и распознавания голосовых сообщений
+_VOICE_SEMAPHORE = asyncio.Semaphore(8)
+
+# Сколько голосовых сообщений одного пользователя обрабатывается одновременно
+USER_VOICE_CONCURRENCY = 2
+
+# Семафоры пользователей вместе с числом ожидающих их задач;
+# запись удаляется, как только у пользователя не остаётся голосовых в работе
+_user_voice_semaphores: Dict[int, list] = {}
+
+# Типы документов, которые можно отправить на обработку
+SUPPORTED_DOCUMENT_MIME_TYPES = frozenset({
+    'text/plain', 'text/html', 'text/csv', 'text/markdown',
+    'application/pdf', 'application/json',
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp'
+})
+
+# Через сколько секунд накопленные изменения пользователей и чатов сохраняются в базу
+FLUSH_INTERVAL = 5
+
+# Данные аккаунта BotHub в пользователе. Если их изменение потеряется при сбое, следующий
+# запрос заново авторизуется в BotHub и может создать второго пользователя, поэтому
+# такие изменения записываются в базу сразу, а не через FLUSH_INTERVAL
+bothub_identity = attrgetter(
+    "bothub_id", "bothub_group_id", "bothub_access_token", "bothub_access_token_created_at"
+)
+
+# Сколько секунд пользователь и чат, прочитанные из базы, считаются актуальными
+CACHE_TTL = 300.0
+
+# Максимальное число записей в кэшах пользователей и чатов
+CACHE_MAX_SIZE = 10_000
+
+# Часть длинного сообщения: до 3900 символов (с запасом для Markdown), по возможности
+# заканчивается перед переводом строки, иначе текст режется по длине
+MESSAGE_PART_RE = re.compile(r'.{1,3900}(?=\n|\Z)|.{1,3900}', re.DOTALL)
+
+# Ограничитель блока кода Markdown: при разбиении текста блок закрывается
+# в конце части и открывается заново в следующей
+CODE_FENCE = "```"
+
+# Хранилище BotHub, из которого отдаются вложения без прямой ссылки
+BOTHUB_STORAGE_URL = "https://storage.bothub.chat/bothub-storage/"
+
+# Хосты Discord, ссылки которых имеют истекающую подпись и недоступны извне.
+# Такие изображения не отправляются вовсе
+UNREACHABLE_IMAGE_HOSTS = frozenset({"cdn.discordapp.com", "media.discordapp.net"})
+
+# Часть пути локальных файлов генератора, которые тоже недоступны извне
+UNREACHABLE_IMAGE_PATH = "local/images"
+
+# Расширения, с которыми изображение загружается в Telegram как фото
+PHOTO_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".webp", ".gif"})
+
+# Максимальное число фотографий в одной медиагруппе Telegram
+MEDIA_GROUP_LIMIT = 10
+
+# Сколько медиагрупп одного ответа отправляется одновременно
+MEDIA_SEND_CONCURRENCY = 4
+
+# Telegram показывает статус около 5 секунд, поэтому при обработке одного сообщения
+# тот же статус повторно отправляется не чаще, чем раз в CHAT_ACTION_INTERVAL секунд.
+# Ответ бота сбрасывает статус, поэтому для нового сообщения он отправляется всегда
+CHAT_ACTION_INTERVAL = 4.0
+
+# Последний отправленный в чат статус: сообщение, статус и время отправки
+_last_chat_actions: Dict[int, tuple] = {}
+
+# Тексты ответов на команды
+START_MESSAGE = (
+    "👋 Привет! Я BotHub, умный ассистент на базе нейросетей.\n\n"
+    "✨ Я могу:\n"
+    "📝 Общаться с вами, отвечать на вопросы\n"
+    "🔍 Искать информацию в интернете\n"
+    "🎨 Генерировать изображения\n\n"
+    "Просто напишите мне, что вы хотите, и я автоматически определю ваше намерение!\n\n"
+    "Полезные команды:\n"
+    "/reset - сбросить контекст разговора\n"
+    "/help - получить справку"
+)
+
+# Справка собирается с готовой разметкой один раз: Telegram не разбирает Markdown
+# при каждой отправке, а спецсимволы в тексте не ломают сообщение
+HELP_MESSAGE = Text(
+    "🔍 ", Bold("Как пользоваться ботом:"), "\n\n",
+    "1. ", Bold("Для обычного общения"), " просто напишите свой вопрос или сообщение\n",
+    "   Например: ", Italic("\"Расскажи о квантовой физике\""), "\n\n",
+    "2. ", Bold("Для поиска в интернете"), " используйте слова: найди, поищи, загугли\n",
+    "   Например: ", Italic("\"Найди информацию о последних новостях\""), "\n\n",
+    "3. ", Bold("Для генерации изображений"), " используйте слова: нарисуй, сгенерируй, создай\n",
+    "   Например: ", Italic("\"Нарисуй красивый закат над океаном\""), "\n\n",
+    "📋 ", Bold("Полезные команды:"), "\n",
+    "/reset - сбросить контекст разговора\n",
+    "/help - получить эту справку"
+).as_kwargs()
+
+RESET_MESSAGE = "🔄 Контекст разговора сброшен! Теперь я не буду учитывать предыдущие сообщения."
+
+MISSING_BOT_TOKEN_MESSAGE = "❌ Ошибка: токен бота отсутствует"
+
+BOTHUB_TIMEOUT_MESSAGE = "❌ Модель не ответила вовремя, попробуйте ещё раз."
+
+OVERLOADED_MESSAGE = "⏳ Система загружена, попробуйте отправить сообщение чуть позже."
+
+# Ответы на непредвиденные ошибки обработчиков в зависимости от типа сообщения
+ERROR_MESSAGES = {
+    ContentType.VOICE: "❌ Извините, произошла ошибка при обработке голосового сообщения",
+    ContentType.PHOTO: "❌ Извините, произошла ошибка при обработке фотографии",
+    ContentType.DOCUMENT: "❌ Извините, произошла ошибка при обработке документа",
+}
+
+ERROR_MESSAGE = "❌ Извините, произошла ошибка при обработке сообщения"
+
+# Ссылки на фоновые задачи, чтобы их не удалил сборщик мусора до завершения
+_background_tasks = set()
+
 # Создаём роутер для aiogram
 dp = Router()
 
 
+def _on_background_task_done(task: asyncio.Task) -> None:
+    """Освобождает ссылку на фоновую задачу и логирует её ошибку"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.warning("Background task failed: %s", task.exception())
+
+
+def run_in_background(coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+    """Запускает корутину в фоне, не дожидаясь её завершения"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+
+async def bothub_request(coro: Awaitable[T]) -> T:
+    """
+    Выполняет запрос к BotHub с ограничением числа одновременных запросов.
+    Зависший запрос прерывается по таймауту, чтобы не занимать слот семафора
+    """
+    global _bothub_requests
+    _bothub_requests += 1
+    try:
+        async with _BOTHUB_SEMAPHORE:
+            return await asyncio.wait_for(coro, BOTHUB_REQUEST_TIMEOUT)
+    finally:
+        _bothub_requests -= 1
+
+
+def bothub_overloaded() -> bool:
+    """Проверяет, заполнена ли очередь запросов к BotHub"""
+    return _bothub_requests >= BOTHUB_QUEUE_LIMIT
+
+
+def _cache_get(cache: OrderedDict, key: Any, ttl: float) -> Optional[Any]:
+    """Возвращает значение из кэша, если оно ещё не устарело"""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+
+    stored_at, value = entry
+    if time.monotonic() - stored_at >= ttl:
+        del cache[key]
+        return None
+
+    cache.move_to_end(key)
+    return value
+
+
+def _cache_put(cache: OrderedDict, key: Any, value: Any, ttl: float, max_size: int) -> None:
+    """Сохраняет значение в кэш, вытесняя самую давнюю запись при переполнении"""
+    if ttl <= 0:
+        return
+
+    cache[key] = (time.monotonic(), value)
+    cache.move_to_end(key)
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+
+
+@asynccontextmanager
+async def user_voice_slot(user_id: int):
+    """Ограничивает число одновременно обрабатываемых голосовых одного пользователя"""
+    entry = _user_voice_semaphores.get(user_id)
+    if entry is None:
+        entry = _user_voice_semaphores[user_id] = [asyncio.Semaphore(USER_VOICE_CONCURRENCY), 0]
+
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _user_voice_semaphores[user_id]
+
+
+def chat_action_delay(message: Message, action: ChatAction) -> float:
+    """Сколько секунд ещё показывается тот же статус, уже отправленный при обработке сообщения"""
+    last = _last_chat_actions.get(message.chat.id)
+    if last is None or last[0] != message.message_id or last[1] != action:
+        return 0.0
+    return max(0.0, CHAT_ACTION_INTERVAL - (time.monotonic() - last[2]))
+
+
+def send_chat_action(message: Message, action: ChatAction) -> None:
+    """Отправляет статус (печатает, записывает...) в фоне, не задерживая ответ"""
+    if chat_action_delay(message, action):
+        return
+
+    now = time.monotonic()
+    if len(_last_chat_actions) >= CACHE_MAX_SIZE:
+        # Удаляем записи, статус которых уже не отображается
+        for key in [key for key, (_, _, sent_at) in _last_chat_actions.items()
+                    if now - sent_at >= CHAT_ACTION_INTERVAL]:
+            del _last_chat_actions[key]
+    _last_chat_actions[message.chat.id] = (message.message_id, action, now)
+    # chat.do возвращает объект метода, а не корутину, поэтому вызываем метод бота
+    run_in_background(message.bot.send_chat_action(chat_id=message.chat.id, action=action))
+
+
+def split_message(content: str) -> list:
+    """Разбивает длинный текст на части, не оставляя блоки кода незакрытыми"""
+    parts = []
+    in_code = False
+    language = ""
+    for part in MESSAGE_PART_RE.findall(content):
+        opened = in_code
+        fences = part.count(CODE_FENCE)
+        if fences % 2:
+            in_code = not in_code
+        if in_code and fences:
+            # Блок остался открытым после последнего ограничителя части: запоминаем его язык
+            language = part[part.rindex(CODE_FENCE) + len(CODE_FENCE):].split("\n", 1)[0]
+
+        if opened:
+            # Если часть отрезана по длине, а не перед переводом строки, без "\n"
+            # Telegram принял бы её первое слово за язык блока
+            part = CODE_FENCE + language + ("" if part.startswith("\n") else "\n") + part
+        if in_code:
+            part += "\n" + CODE_FENCE
+        parts.append(part)
+    return parts
+
+
+def attachment_image_url(attachment: Dict[str, Any]) -> Optional[str]:
+    """
+    Возвращает ссылку на изображение из вложения BotHub.
+    Ссылки не по HTTP и заведомо недоступные ссылки Telegram не скачает,
+    поэтому для них возвращается None без попыток отправки
+    """
+    file = attachment.get("file", {})
+    url = file.get("url")
+    if not url and file.get("path"):
+        url = BOTHUB_STORAGE_URL + file["path"]
+    if not url:
+        return url
+    parts = urlsplit(url)
+    if (parts.scheme not in ("http", "https")
+            or parts.hostname in UNREACHABLE_IMAGE_HOSTS
+            or UNREACHABLE_IMAGE_PATH in parts.path):
+        logger.warning("Skipping attachment with unreachable URL: %s", url)
+        return None
+    return url
+
+
+def photo_filename(url: str) -> str:
+    """Имя файла изображения по расширению в пути ссылки, без параметров запроса"""
+    path = url.split("?", 1)[0].split("#", 1)[0]
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in PHOTO_EXTENSIONS:
+        extension = ".jpg"
+    return "image" + extension
+
+
+async def download_photo(url: str) -> BufferedInputFile:
+    """Скачивает изображение в память для загрузки в Telegram"""
+    return BufferedInputFile(await download_bytes(url), filename=photo_filename(url))
+
+
+async def send_photo_group(message: Message, media: list) -> None:
+    """Отправляет одно изображение или медиагруппу"""
+    if len(media) == 1:
+        await message.answer_photo(media[0])
+    else:
+        await message.answer_media_group([InputMediaPhoto(media=item) for item in media])
+
+
+async def send_photos(message: Message, urls: list) -> None:
+    """
+    Отправляет изображения медиагруппами вместо отдельного сообщения на каждое.
+    Изображения передаются ссылками и скачиваются самим Telegram; только если он
+    не смог их получить, бот скачивает их в память и загружает сам
+    """
+    semaphore = asyncio.Semaphore(MEDIA_SEND_CONCURRENCY)
+
+    async def send_group(group: list) -> None:
+        async with semaphore:
+            try:
+                await send_photo_group(message, group)
+            except TelegramBadRequest as e:
+                logger.warning("Telegram could not fetch images by URL, uploading them: %s", e)
+                files = await asyncio.gather(*(download_photo(url) for url in group))
+                await send_photo_group(message, files)
+
+    # Медиагруппы независимы, поэтому отправляем их одновременно
+    await asyncio.gather(*(
+        send_group(urls[i:i + MEDIA_GROUP_LIMIT])
+        for i in range(0, len(urls), MEDIA_GROUP_LIMIT)
+    ))
+
+
+def keep_chat_action(message: Message, action: ChatAction) -> ChatActionSender:
+    """
+    Повторяет статус каждые 5 секунд, пока выполняется долгий запрос.
+    Статус отправляется фоновой задачей, поэтому запрос начинается сразу.
+    Если тот же статус только что отправлен для этого сообщения, первая отправка откладывается
+    """
+    return ChatActionSender(
+        bot=message.bot,
+        chat_id=message.chat.id,
+        action=action,
+        initial_sleep=chat_action_delay(message, action)
+    )
+
+
+async def answer_while(message: Message, text: str, request: Awaitable[T]) -> Tuple[Optional[Message], T]:
+    """
+    Отправляет уведомление о статусе, пока выполняется запрос.
+    Запрос запускается до отправки уведомления и доводится до конца, даже если
+    уведомление отправить не удалось; в этом случае вместо уведомления возвращается None
+    """
+    task = asyncio.ensure_future(request)
+    try:
+        try:
+            notice = await message.answer(text, parse_mode=None)
+        except TelegramAPIError as e:
+            logger.warning("Failed to send status notice to chat %s: %s", message.chat.id, e)
+            notice = None
+        return notice, await task
+    except BaseException:
+        # Обработчик прерван: запрос больше никто не ждёт
+        task.cancel()
+        raise
+
+
 def create_handlers(
         chat_session_usecase: ChatSessionUseCase,
         web_search_usecase: WebSearchUseCase,
         image_generation_usecase: ImageGenerationUseCase,
         intent_detection_service: IntentDetectionService,
         user_repository: UserRepository,
-        chat_repository: ChatRepository
+        chat_repository: ChatRepository,
+        cache_ttl: float = CACHE_TTL,
+        cache_max_size: int = CACHE_MAX_SIZE
 ):
-    """Фабричный метод для создания обработчиков сообщений Telegram"""
+    """
+    Фабричный метод для создания обработчиков сообщений Telegram
+
+    cache_ttl задаёт время жизни кэша пользователей и чатов в секундах, 0 отключает кэш
+    """
+
+    # Счётчик контекста меняется на каждом сообщении, поэтому изменения пользователей
+    # и чатов копятся в памяти и сохраняются пачкой раз в FLUSH_INTERVAL.
+    # Пока запись не завершена, пользователь и чат читаются отсюда, а не из базы
+    pending_users: Dict[str, User] = {}
+    flushing_users: Dict[str, User] = {}
+    pending_chats: Dict[tuple, Chat] = {}
+    flushing_chats: Dict[tuple, Chat] = {}
+    flush_task: Optional[asyncio.Task] = None
+    # Записи идут по одной, чтобы остановка бота дождалась уже начатой записи
+    flush_lock = asyncio.Lock()
+
+    # Пользователи и чаты, недавно прочитанные из базы: сообщения активных пользователей
+    # не должны каждый раз обращаться к базе. Обработчики изменяют закэшированные
+    # объекты на месте, поэтому записи в базу сразу отражаются и в кэше
+    user_cache: OrderedDict = OrderedDict()
+    chat_cache: OrderedDict = OrderedDict()
+
+    async def flush_pending(pending: Dict, flushing: Dict, update_many) -> None:
+        """Сохраняет накопленные изменения одной транзакцией"""
+        if not pending:
+            return
+
+        items = dict(pending)
+        pending.clear()
+        flushing.update(items)
+        try:
+            await update_many(list(items.values()))
+        except Exception as e:
+            # Снимок в save_changes не увидит эти изменения повторно, поэтому возвращаем
+            # их в очередь, если объект не попал туда снова, и повторяем запись позже
+            logger.warning("Failed to save %d pending changes, retrying later: %s", len(items), e)
+            for key, item in items.items():
+                pending.setdefault(key, item)
+            schedule_flush()
+        finally:
+            for key, item in items.items():
+                if flushing.get(key) is item:
+                    del flushing[key]
+
+    async def flush_changes() -> None:
+        """Сохраняет накопленные изменения пользователей и чатов"""
+        async with flush_lock:
+            await asyncio.gather(
+                flush_pending(pending_users, flushing_users, user_repository.update_many),
+                flush_pending(pending_chats, flushing_chats, chat_repository.update_many)
+            )
 
-    async def get_or_create_user(message: Message) -> User:
+    async def flush_changes_later() -> None:
+        """Сохраняет изменения после паузы, объединяя их в одну запись"""
+        nonlocal flush_task
+        try:
+            await asyncio.sleep(FLUSH_INTERVAL)
+        finally:
+            flush_task = None
+        await flush_changes()
+
+    def schedule_flush() -> None:
+        """Запускает отложенное сохранение, если оно ещё не запланировано"""
+        nonlocal flush_task
+        if flush_task is None:
+            flush_task = run_in_background(flush_changes_later())
+
+    def save_user_later(user: User) -> None:
+        """Помечает пользователя для отложенного сохранения"""
+        pending_users[user.telegram_id] = user
+        schedule_flush()
+
+    def save_user_now(user: User) -> None:
+        """Сохраняет пользователя сразу, не дожидаясь отложенной записи"""
+        pending_users[user.telegram_id] = user
+        # Запись идёт через общую очередь: при ошибке пользователь останется в ней,
+        # а остановка бота дождётся начатой записи
+        run_in_background(flush_changes())
+
+    def save_chat_later(chat: Chat) -> None:
+        """Помечает чат для отложенного сохранения"""
+        pending_chats[(chat.user_id, chat.chat_index)] = chat
+        schedule_flush()
+
+    @dp.shutdown()
+    async def on_shutdown():
+        """Сохраняет изменения пользователей и чатов перед остановкой бота"""
+        if flush_task is not None:
+            flush_task.cancel()
+        # Дожидается уже начатой записи и сохраняет всё, что накопилось после неё
+        await flush_changes()
+        if pending_users or pending_chats:
+            logger.error("Unsaved changes lost on shutdown: %d users, %d chats",
+                         len(pending_users), len(pending_chats))
+
+    def snapshot(user: User, chat: Chat) -> tuple:
+        """Снимок пользователя и чата, чтобы после обработки сохранить только изменения"""
+        return astuple(user), astuple(chat), bothub_identity(user)
+
+    def save_changes(user: User, chat: Chat, state: tuple) -> None:
+        """Помечает для сохранения пользователя и чат, если обработка сообщения их изменила"""
+        user_state, chat_state, identity_state = state
+        if astuple(chat) != chat_state:
+            save_chat_later(chat)
+        if bothub_identity(user) != identity_state:
+            save_user_now(user)
+        elif astuple(user) != user_state:
+            save_user_later(user)
+
+    # Чаты BotHub, создание которых начато заранее, чтобы первое сообщение
+    # пользователя не ждало авторизации и создания группы и чата
+    bothub_chat_tasks: Dict[tuple, asyncio.Task] = {}
+
+    async def create_bothub_chat(user: User, chat: Chat) -> None:
+        """Создаёт чат BotHub и сохраняет полученные идентификаторы"""
+        state = snapshot(user, chat)
+        try:
+            await bothub_request(chat_session_usecase.create_new_chat(user, chat))
+        finally:
+            # Группа могла быть создана, даже если создание чата не удалось
+            save_changes(user, chat, state)
+
+    def prewarm_bothub_chat(user: User, chat: Chat) -> None:
+        """Начинает создание чата BotHub в фоне, если его ещё нет"""
+        key = (chat.user_id, chat.chat_index)
+        if chat.bothub_chat_id or key in bothub_chat_tasks:
+            return
+
+        task = run_in_background(create_bothub_chat(user, chat))
+        bothub_chat_tasks[key] = task
+        task.add_done_callback(lambda _: bothub_chat_tasks.pop(key, None))
+
+    async def wait_bothub_chat(chat: Chat) -> None:
+        """Дожидается начатого заранее создания чата BotHub, чтобы не создать второй"""
+        # У созданного чата идентификатор уже заполнен, ждать нечего
+        if chat.bothub_chat_id:
+            return
+
+        task = bothub_chat_tasks.get((chat.user_id, chat.chat_index))
+        if task is not None:
+            # Ошибка фонового создания не важна: чат будет создан при отправке сообщения
+            await asyncio.wait([task])
+
+    async def get_or_create_user(message: Message, referral_code: Optional[str] = None) -> User:
         """Получение или создание пользователя из сообщения Telegram"""
         telegram_id = str(message.from_user.id)
-        user = await user_repository.find_by_telegram_id(telegram_id)
+        user = (pending_users.get(telegram_id) or flushing_users.get(telegram_id)
+                or _cache_get(user_cache, telegram_id, cache_ttl))
+        if user is None:
+            user = await user_repository.find_by_telegram_id(telegram_id)
 
         if not user:
             user = User(
@@ -42,15 +559,25 @@ def create_handlers(
                 last_name=message.from_user.last_name,
                 username=message.from_user.username,
                 language_code=message.from_user.language_code,
-                current_chat_index=1
+                current_chat_index=1,
+                referral_code=referral_code
             )
             user_id = await user_repository.save(user)
             user.id = user_id
+        elif referral_code and user.referral_code != referral_code:
+            user.referral_code = referral_code
+            await user_repository.update_referral_code(user.id, referral_code)
 
+        _cache_put(user_cache, telegram_id, user, cache_ttl, cache_max_size)
         return user
 
     async def get_or_create_chat(user: User) -> Chat:
         """Получение или создание чата для пользователя"""
+        key = (user.id, user.current_chat_index)
+        chat = pending_chats.get(key) or flushing_chats.get(key) or _cache_get(chat_cache, key, cache_ttl)
+        if chat:
+            return chat
+
         chat = await chat_repository.find_by_user_id_and_chat_index(
             user.id,
             user.current_chat_index
@@ -65,49 +592,218 @@ def create_handlers(
             chat_id = await chat_repository.save(chat)
             chat.id = chat_id
 
+        _cache_put(chat_cache, key, chat, cache_ttl, cache_max_size)
         return chat
 
-    async def send_long_message(message: Message, content: str):
-        """Отправляет длинное сообщение, разбивая его на части, если необходимо."""
+    async def transcribe_voice(user: User, chat: Chat, file_url: str, file_path: Optional[str]) -> str:
+        """Распознавание голосового сообщения с ограничением числа одновременных загрузок"""
+        # Сначала ждём очереди пользователя, чтобы его голосовые не занимали общие слоты
+        async with user_voice_slot(user.id), _VOICE_SEMAPHORE:
+            return await chat_session_usecase.transcribe_voice(user, chat, file_url, file_path)
+
+    async def send_long_message(message: Message, content: str, notice: Optional[Message] = None):
+        """
+        Отправляет длинное сообщение, разбивая его на части, если необходимо.
+
+        Если передано уведомление о статусе, первая часть заменяет его текст
+        вместо отправки нового сообщения.
+        """
         if len(content) <= 3900:  # Уменьшенный порог для учета Markdown
-            await message.answer(content, parse_mode="Markdown")
-            return
+            parts = [content]
+        else:
+            parts = split_message(content)
 
-        parts = []
-        while content:
-            if len(content) <= 3900:
-                parts.append(content)
-                content = ""
-            else:
-                last_newline = content[:3900].rfind("\n")
-                if last_newline == -1:
-                    last_newline = 3900
-                parts.append(content[:last_newline])
-                content = content[last_newline:]
+        if notice is not None:
+            await notice.edit_text(parts[0], parse_mode="Markdown")
+            parts = parts[1:]
 
+        # Части отправляем по очереди: одновременные запросы могут прийти не по порядку,
+        # а ограничитель частоты всё равно отправляет их в чат не чаще раза в секунду
         for part in parts:
             await message.answer(part, parse_mode="Markdown")
 
+    async def process_chat(message: Message, user: User, chat: Chat, text: str,
+                           intent_data: Dict[str, Any]) -> None:
+        """Обычный чат с ИИ"""
+        try:
+            # Ответ модели может занять больше 5 секунд, поэтому статус обновляется
+            async with keep_chat_action(message, ChatAction.TYPING):
+                response = await bothub_request(chat_session_usecase.send_message(
+                    user,
+                    chat,
+                    text,
+                    None  # TODO: поддержка файлов
+                ))
+
+            content = response.get("response", {}).get("content", "Извините, произошла ошибка")
+
+            # Проверяем на наличие формул (будет реализовано позже)
+            if chat.formula_to_image:
+                # TODO: Обработка формул
+                pass
+
+            # Если есть счетчик капсов, добавляем его к ответу, чтобы не отправлять
+            # отдельное сообщение; длинный ответ всё равно будет разбит на части
+            tokens = response.get("tokens")
+            if tokens is not None:
+                content = f"{content}\n\n👾 -{tokens} caps"
+
+            await send_long_message(message, content)
+
+        except asyncio.TimeoutError:
+            logger.warning("Error in chat session: BotHub request timed out for user %s", user.id)
+            await message.answer(BOTHUB_TIMEOUT_MESSAGE, parse_mode=None)
+        except Exception as e:
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error in chat session: %s", e)
+            else:
+                logger.exception("Error in chat session: %s", e)
+            await message.answer(
+                f"❌ Не удалось получить ответ от чата: {str(e)}",
+                parse_mode=None
+            )
+
+    async def process_web_search(message: Message, user: User, chat: Chat, text: str,
+                                 intent_data: Dict[str, Any]) -> None:
+        """Поиск в интернете"""
+        try:
+            # Уведомление отправляем одновременно с запросом, не задерживая поиск
+            async with keep_chat_action(message, ChatAction.TYPING):
+                notice, response = await answer_while(
+                    message,
+                    "🔍 Ищу информацию в интернете...",
+                    bothub_request(web_search_usecase.search(
+                        user,
+                        chat,
+                        intent_data.get("query", text),
+                        None  # TODO: поддержка файлов
+                    ))
+                )
+
+            content = response.get("response", {}).get("content", "Извините, я не смог найти информацию")
+            await send_long_message(message, content, notice)
+
+        except asyncio.TimeoutError:
+            logger.warning("Error in web search: BotHub request timed out for user %s", user.id)
+            await message.answer(BOTHUB_TIMEOUT_MESSAGE, parse_mode=None)
+        except Exception as e:
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error in web search: %s", e)
+            else:
+                logger.exception("Error in web search: %s", e)
+            await message.answer(
+                f"❌ Не удалось выполнить поиск: {str(e)}",
+                parse_mode=None
+            )
+
+    async def process_image_generation(message: Message, user: User, chat: Chat, text: str,
+                                       intent_data: Dict[str, Any]) -> None:
+        """Генерация изображения"""
+        try:
+            prompt = intent_data.get("prompt", text)
+            notice = "🎨 Генерирую изображение..."
+
+            # Проверка запроса на английском языке (некоторые модели требуют это)
+            if not re.search(r'[a-zA-Z]', prompt):
+                notice += "\nℹ️ Добавляю в запрос английский перевод для лучшего результата..."
+                prompt += "\n\nTranslate the above to English"
+
+            # Уведомление отправляем одновременно с запросом, не задерживая генерацию
+            async with keep_chat_action(message, ChatAction.UPLOAD_PHOTO):
+                _, response = await answer_while(
+                    message,
+                    notice,
+                    bothub_request(image_generation_usecase.generate_image(
+                        user,
+                        chat,
+                        prompt,
+                        None  # TODO: поддержка файлов
+                    ))
+                )
+
+            attachments = response.get("response", {}).get("attachments", [])
+            if attachments:
+                image_urls = []
+                missing_urls = 0
+                for attachment in attachments:
+                    if attachment.get("file", {}).get("type") == "IMAGE":
+                        url = attachment_image_url(attachment)
+                        if url:
+                            image_urls.append(url)
+
+                            # Если есть кнопки, добавляем их
+                            buttons = attachment.get("buttons", [])
+                            mj_buttons = [b for b in buttons if b.get("type") == "MJ_BUTTON"]
+                            if mj_buttons:
+                                # TODO: Добавить поддержку кнопок Midjourney
+                                pass
+                        else:
+                            missing_urls += 1
+
+                # Все изображения отправляем одним запросом
+                if image_urls:
+                    await send_photos(message, image_urls)
+
+                for _ in range(missing_urls):
+                    await message.answer(
+                        "❌ Не удалось получить URL изображения",
+                        parse_mode=None
+                    )
+            else:
+                await message.answer(
+                    "❌ Извините, не удалось сгенерировать изображение",
+                    parse_mode=None
+                )
+
+        except asyncio.TimeoutError:
+            logger.warning("Error in image generation: BotHub request timed out for user %s", user.id)
+            await message.answer(BOTHUB_TIMEOUT_MESSAGE, parse_mode=None)
+        except Exception as e:
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error in image generation: %s", e)
+            else:
+                logger.exception("Error in image generation: %s", e)
+            await message.answer(
+                f"❌ Не удалось сгенерировать изображение: {str(e)}",
+                parse_mode=None
+            )
+
+    # Обработчики намерений, общие для текстовых и голосовых сообщений
+    intent_handlers = {
+        IntentType.CHAT: process_chat,
+        IntentType.WEB_SEARCH: process_web_search,
+        IntentType.IMAGE_GENERATION: process_image_generation,
+    }
+
+    @dp.error()
+    async def handle_error(event: ErrorEvent):
+        """Непредвиденные ошибки обработчиков: логируем и сообщаем пользователю"""
+        logger.error("Error processing update %s: %s", event.update.update_id, event.exception,
+                     exc_info=event.exception)
+        message = event.update.message
+        if message is None:
+            return
+
+        await message.answer(
+            ERROR_MESSAGES.get(message.content_type, ERROR_MESSAGE),
+            parse_mode=None
+        )
+
     @dp.message(Command("start"))
     async def handle_start_command(message: Message):
         """Обработка команды /start"""
-        user = await get_or_create_user(message)
-        # Проверяем наличие реферального кода
-        if message.text and len(message.text.split()) > 1:
-            user.referral_code = message.text.split()[1]
-            await user_repository.update(user)
+        # Проверяем наличие реферального кода, новый пользователь сохраняется сразу с ним
+        args = message.text.split() if message.text else []
+        referral_code = args[1] if len(args) > 1 else None
+        user = await get_or_create_user(message, referral_code)
+        chat = await get_or_create_chat(user)
+
+        # Пока пользователь читает приветствие, готовим его чат в BotHub
+        prewarm_bothub_chat(user, chat)
 
         await message.answer(
-            "👋 Привет! Я BotHub, умный ассистент на базе нейросетей.\n\n"
-            "✨ Я могу:\n"
-            "📝 Общаться с вами, отвечать на вопросы\n"
-            "🔍 Искать информацию в интернете\n"
-            "🎨 Генерировать изображения\n\n"
-            "Просто напишите мне, что вы хотите, и я автоматически определю ваше намерение!\n\n"
-            "Полезные команды:\n"
-            "/reset - сбросить контекст разговора\n"
-            "/help - получить справку",
-            parse_mode="Markdown"
+            START_MESSAGE,
+            parse_mode=None
         )
 
     @dp.message(Command("reset"))
@@ -115,417 +811,262 @@ def create_handlers(
         """Обработка команды /reset для сброса контекста"""
         user = await get_or_create_user(message)
         chat = await get_or_create_chat(user)
+        await wait_bothub_chat(chat)
 
         # Сбрасываем счетчик контекста и контекст на сервере BotHub
         await chat_session_usecase.reset_context(user, chat)
         await chat_repository.update(chat)
 
         await message.answer(
-            "🔄 Контекст разговора сброшен! Теперь я не буду учитывать предыдущие сообщения.",
-            parse_mode="Markdown"
+            RESET_MESSAGE,
+            parse_mode=None
         )
 
     @dp.message(Command("help"))
     async def handle_help_command(message: Message):
         """Обработка команды /help"""
-        await message.answer(
-            "🔍 **Как пользоваться ботом:**\n\n"
-            "1. **Для обычного общения** просто напишите свой вопрос или сообщение\n"
-            "   Например: *\"Расскажи о квантовой физике\"*\n\n"
-            "2. **Для поиска в интернете** используйте слова: найди, поищи, загугли\n"
-            "   Например: *\"Найди информацию о последних новостях\"*\n\n"
-            "3. **Для генерации изображений** используйте слова: нарисуй, сгенерируй, создай\n"
-            "   Например: *\"Нарисуй красивый закат над океаном\"*\n\n"
-            "📋 **Полезные команды:**\n"
-            "/reset - сбросить контекст разговора\n"
-            "/help - получить эту справку",
-            parse_mode="Markdown"
-        )
+        await message.answer(**HELP_MESSAGE)
 
     @dp.message(F.text)
     async def handle_text_message(message: Message):
         """Обработка текстовых сообщений"""
-        try:
-            # Сообщаем пользователю, что бот печатает
-            await message.chat.do(ChatAction.TYPING)
-
-            # Получаем или создаём пользователя и его текущий чат
-            user = await get_or_create_user(message)
-            chat = await get_or_create_chat(user)
-
-            # Определяем намерение пользователя
-            intent_type, intent_data = intent_detection_service.detect_intent(message.text)
-            logger.info(f"Detected intent: {intent_type.value} for message: {message.text[:50]}...")
-
-            if intent_type == IntentType.CHAT:
-                # Обычный чат с ИИ
-                await message.chat.do(ChatAction.TYPING)
-                try:
-                    response = await chat_session_usecase.send_message(
-                        user,
-                        chat,
-                        message.text,
-                        None  # TODO: поддержка файлов
-                    )
-
-                    content = response.get("response", {}).get("content", "Извините, произошла ошибка")
-
-                    # Проверяем на наличие формул (будет реализовано позже)
-                    if chat.formula_to_image:
-                        # TODO: Обработка формул
-                        pass
-
-                    await send_long_message(message, content)
-
-                    # Если есть счетчик капсов, добавляем его
-                    if "tokens" in response:
-                        caps_text = f"👾 -{response['tokens']} caps"
-                        await message.answer(caps_text)
-
-                except Exception as e:
-                    logger.error(f"Error in chat session: {e}", exc_info=True)
-                    await message.answer(
-                        f"❌ Не удалось получить ответ от чата: {str(e)}",
-                        parse_mode="Markdown"
-                    )
-
-            elif intent_type == IntentType.WEB_SEARCH:
-                # Поиск в интернете
-                await message.answer(
-                    "🔍 Ищу информацию в интернете...",
-                    parse_mode="Markdown"
-                )
-                await message.chat.do(ChatAction.TYPING)
-
-                try:
-                    response = await web_search_usecase.search(
-                        user,
-                        chat,
-                        intent_data.get("query", message.text),
-                        None  # TODO: поддержка файлов
-                    )
-
-                    content = response.get("response", {}).get("content", "Извините, я не смог найти информацию")
-                    await send_long_message(message, content)
-
-                except Exception as e:
-                    logger.error(f"Error in web search: {e}", exc_info=True)
-                    await message.answer(
-                        f"❌ Не удалось выполнить поиск: {str(e)}",
-                        parse_mode="Markdown"
-                    )
-
-            elif intent_type == IntentType.IMAGE_GENERATION:
-                # Генерация изображения
-                await message.answer(
-                    "🎨 Генерирую изображение...",
-                    parse_mode="Markdown"
-                )
-
-                try:
-                    prompt = intent_data.get("prompt", message.text)
-
-                    # Проверка запроса на английском языке (некоторые модели требуют это)
-                    if not re.search(r'[a-zA-Z]', prompt):
-                        await message.answer(
-                            "ℹ️ Добавляю в запрос английский перевод для лучшего результата...",
-                            parse_mode="Markdown"
-                        )
-                        prompt += "\n\nTranslate the above to English"
+        # Очередь к BotHub переполнена: отвечаем сразу, не нагружая базу и API
+        if bothub_overloaded():
+            await message.answer(OVERLOADED_MESSAGE, parse_mode=None)
+            return
 
-                    response = await image_generation_usecase.generate_image(
-                        user,
-                        chat,
-                        prompt,
-                        None  # TODO: поддержка файлов
-                    )
+        # Сообщаем пользователю, что бот печатает
+        send_chat_action(message, ChatAction.TYPING)
 
-                    attachments = response.get("response", {}).get("attachments", [])
-                    if attachments:
-                        for attachment in attachments:
-                            if attachment.get("file", {}).get("type") == "IMAGE":
-                                url = attachment.get("file", {}).get("url")
-                                if not url and attachment.get("file", {}).get("path"):
-                                    url = f"https://storage.bothub.chat/bothub-storage/{attachment.get('file', {}).get('path')}"
-
-                                if url:
-                                    await message.answer_photo(url)
-
-                                    # Если есть кнопки, добавляем их
-                                    buttons = attachment.get("buttons", [])
-                                    mj_buttons = [b for b in buttons if b.get("type") == "MJ_BUTTON"]
-                                    if mj_buttons:
-                                        # TODO: Добавить поддержку кнопок Midjourney
-                                        pass
-                                else:
-                                    await message.answer(
-                                        "❌ Не удалось получить URL изображения",
-                                        parse_mode="Markdown"
-                                    )
-                    else:
-                        await message.answer(
-                            "❌ Извините, не удалось сгенерировать изображение",
-                            parse_mode="Markdown"
-                        )
-
-                except Exception as e:
-                    logger.error(f"Error in image generation: {e}", exc_info=True)
-                    await message.answer(
-                        f"❌ Не удалось сгенерировать изображение: {str(e)}",
-                        parse_mode="Markdown"
-                    )
+        # Получаем или создаём пользователя и его текущий чат
+        user = await get_or_create_user(message)
+        chat = await get_or_create_chat(user)
+        await wait_bothub_chat(chat)
+        state = snapshot(user, chat)
 
-            # Сохраняем обновленные данные
-            await user_repository.update(user)
-            await chat_repository.update(chat)
+        # Определяем намерение пользователя
+        intent_type, intent_data = await intent_detection_service.detect_intent_async(message.text)
+        logger.info("Detected intent: %s for user %s, message length: %d",
+                    intent_type.value, user.id, len(message.text))
+        logger.debug("Message text: %s", message.text)
 
-        except Exception as e:
-            logger.error(f"Error processing message: {e}", exc_info=True)
-            await message.answer(
-                "❌ Извините, произошла ошибка при обработке сообщения",
-                parse_mode="Markdown"
-            )
+        try:
+            await intent_handlers[intent_type](message, user, chat, message.text, intent_data)
+        finally:
+            # Сохраняем только изменившиеся данные, чат записывается отложенно. Неудачный
+            # запрос к BotHub тоже мог изменить токен или чат, поэтому сохраняем и после ошибки
+            save_changes(user, chat, state)
 
     @dp.message(F.voice)
     async def handle_voice_message(message: Message):
         """Обработка голосовых сообщений"""
-        try:
-            # Сообщаем пользователю, что бот обрабатывает аудио
-            await message.chat.do(ChatAction.RECORD_VOICE)
-
-            # Получаем или создаём пользователя и его текущий чат
-            user = await get_or_create_user(message)
-            chat = await get_or_create_chat(user)
-
-            # Скачиваем голосовое сообщение
-            file_id = message.voice.file_id
-            file = await message.bot.get_file(file_id)
-            file_path = file.file_path
-
-            # Проверяем наличие токена
-            if not message.bot.token:
-                logger.error("Bot token is missing")
-                await message.answer("❌ Ошибка: токен бота отсутствует", parse_mode="Markdown")
-                return
-
-            file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
+        # Очередь к BotHub переполнена: отвечаем сразу, не нагружая базу и API
+        if bothub_overloaded():
+            await message.answer(OVERLOADED_MESSAGE, parse_mode=None)
+            return
 
-            await message.answer(
-                "🎤 Обрабатываю голосовое сообщение...",
-                parse_mode="Markdown"
-            )
+        # Сообщаем пользователю, что бот обрабатывает аудио
+        send_chat_action(message, ChatAction.RECORD_VOICE)
 
-            # Транскрибируем голосовое сообщение
-            try:
-                transcribed_text = await chat_session_usecase.transcribe_voice(user, chat, file_url)
+        # Получаем или создаём пользователя и его текущий чат
+        user = await get_or_create_user(message)
+        chat = await get_or_create_chat(user)
+        await wait_bothub_chat(chat)
+        state = snapshot(user, chat)
+
+        # Скачиваем голосовое сообщение
+        file_id = message.voice.file_id
+        file = await message.bot.get_file(file_id)
+        file_path = file.file_path
+
+        # Проверяем наличие токена
+        if not message.bot.token:
+            logger.error("Bot token is missing")
+            await message.answer(MISSING_BOT_TOKEN_MESSAGE, parse_mode=None)
+            return
 
-                # Отправляем пользователю распознанный текст
-                await message.answer(
-                    f"📝 Распознанный текст:\n\n{transcribed_text}",
-                    parse_mode="Markdown"
-                )
+        file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
 
-                # Теперь обрабатываем текст как обычное сообщение, определяя намерение
-                intent_type, intent_data = intent_detection_service.detect_intent(transcribed_text)
-
-                await message.chat.do(ChatAction.TYPING)
-
-                if intent_type == IntentType.CHAT:
-                    response = await chat_session_usecase.send_message(user, chat, transcribed_text)
-                    content = response.get("response", {}).get("content", "Извините, произошла ошибка")
-                    await send_long_message(message, content)
-
-                elif intent_type == IntentType.WEB_SEARCH:
-                    await message.answer("🔍 Ищу информацию в интернете...", parse_mode="Markdown")
-                    response = await web_search_usecase.search(user, chat, intent_data.get("query", transcribed_text))
-                    content = response.get("response", {}).get("content", "Извините, я не смог найти информацию")
-                    await send_long_message(message, content)
-
-                elif intent_type == IntentType.IMAGE_GENERATION:
-                    await message.answer("🎨 Генерирую изображение...", parse_mode="Markdown")
-                    response = await image_generation_usecase.generate_image(user, chat, intent_data.get("prompt",
-                                                                                                         transcribed_text))
-
-                    attachments = response.get("response", {}).get("attachments", [])
-                    if attachments:
-                        for attachment in attachments:
-                            if attachment.get("file", {}).get("type") == "IMAGE":
-                                url = attachment.get("file", {}).get("url")
-                                if not url and attachment.get("file", {}).get("path"):
-                                    url = f"https://storage.bothub.chat/bothub-storage/{attachment.get('file', {}).get('path')}"
-
-                                if url:
-                                    await message.answer_photo(url)
-                                else:
-                                    await message.answer("❌ Не удалось получить URL изображения", parse_mode="Markdown")
-                    else:
-                        await message.answer("❌ Извините, не удалось сгенерировать изображение", parse_mode="Markdown")
-
-                # Сохраняем обновленные данные
-                await user_repository.update(user)
-                await chat_repository.update(chat)
+        # Локальный Telegram Bot API отдаёт абсолютный путь к файлу на общем томе
+        local_path = file_path if os.path.isabs(file_path) else None
 
+        try:
+            # Транскрибируем голосовое сообщение. Уведомление не зависит от распознавания,
+            # поэтому отправляем их одновременно. Перехватываем только ошибки распознавания:
+            # ошибки дальнейшей обработки текста доходят до общего обработчика ошибок
+            try:
+                notice, transcribed_text = await answer_while(
+                    message,
+                    "🎤 Обрабатываю голосовое сообщение...",
+                    transcribe_voice(user, chat, file_url, local_path)
+                )
             except Exception as e:
-                logger.error(f"Error transcribing voice message: {e}", exc_info=True)
+                if isinstance(e, EXPECTED_ERRORS):
+                    logger.warning("Error transcribing voice message: %s", e)
+                else:
+                    logger.exception("Error transcribing voice message: %s", e)
                 await message.answer(
                     "❌ Не удалось распознать голосовое сообщение. Попробуйте отправить текстовое сообщение.",
-                    parse_mode="Markdown"
+                    parse_mode=None
                 )
+                return
 
-        except Exception as e:
-            logger.error(f"Error processing voice message: {e}", exc_info=True)
-            await message.answer(
-                "❌ Извините, произошла ошибка при обработке голосового сообщения",
-                parse_mode="Markdown"
-            )
+            # Показываем распознанный текст на месте уведомления, не отправляя новое сообщение
+            transcription = f"📝 Распознанный текст:\n\n{transcribed_text}"
+            if notice is not None:
+                await notice.edit_text(transcription, parse_mode=None)
+            else:
+                await message.answer(transcription, parse_mode=None)
+
+            # Теперь обрабатываем текст как обычное сообщение, определяя намерение
+            intent_type, intent_data = await intent_detection_service.detect_intent_async(transcribed_text)
+
+            await intent_handlers[intent_type](message, user, chat, transcribed_text, intent_data)
+        finally:
+            # Сохраняем только изменившиеся данные, в том числе после ошибки запроса к BotHub
+            save_changes(user, chat, state)
 
     @dp.message(F.photo)
     async def handle_photo_message(message: Message):
         """Обработка фотографий"""
-        try:
-            # Сообщаем пользователю, что бот обрабатывает фото
-            await message.chat.do(ChatAction.UPLOAD_PHOTO)
-
-            # Получаем или создаём пользователя и его текущий чат
-            user = await get_or_create_user(message)
-            chat = await get_or_create_chat(user)
-
-            # Получаем фото максимального размера
-            photo = message.photo[-1]
-            file_id = photo.file_id
-            file = await message.bot.get_file(file_id)
-            file_path = file.file_path
-
-            # Проверяем наличие токена
-            if not message.bot.token:
-                logger.error("Bot token is missing")
-                await message.answer("❌ Ошибка: токен бота отсутствует", parse_mode="Markdown")
-                return
-
-            file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
-
-            # Получаем описание к фото, если есть
-            caption = message.caption or "Опиши что на этом изображении"
+        # Очередь к BotHub переполнена: отвечаем сразу, не нагружая базу и API
+        if bothub_overloaded():
+            await message.answer(OVERLOADED_MESSAGE, parse_mode=None)
+            return
 
-            await message.answer(
-                "🖼️ Обрабатываю изображение...",
-                parse_mode="Markdown"
-            )
+        # Сообщаем пользователю, что бот обрабатывает фото
+        send_chat_action(message, ChatAction.UPLOAD_PHOTO)
 
-            # Отправляем изображение с текстом на обработку
-            try:
-                await message.chat.do(ChatAction.TYPING)
-                response = await chat_session_usecase.send_message(user, chat, caption, [file_url])
+        # Получаем или создаём пользователя и его текущий чат
+        user = await get_or_create_user(message)
+        chat = await get_or_create_chat(user)
+        await wait_bothub_chat(chat)
+        state = snapshot(user, chat)
+
+        # Получаем фото максимального размера
+        photo = message.photo[-1]
+        file_id = photo.file_id
+        file = await message.bot.get_file(file_id)
+        file_path = file.file_path
+
+        # Проверяем наличие токена
+        if not message.bot.token:
+            logger.error("Bot token is missing")
+            await message.answer(MISSING_BOT_TOKEN_MESSAGE, parse_mode=None)
+            return
 
-                content = response.get("response", {}).get("content", "Извините, не удалось обработать изображение")
-                await send_long_message(message, content)
+        file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
 
-                # Если в ответе есть сгенерированное изображение, отправляем его
-                attachments = response.get("response", {}).get("attachments", [])
-                if attachments:
-                    for attachment in attachments:
-                        if attachment.get("file", {}).get("type") == "IMAGE":
-                            url = attachment.get("file", {}).get("url")
-                            if not url and attachment.get("file", {}).get("path"):
-                                url = f"https://storage.bothub.chat/bothub-storage/{attachment.get('file', {}).get('path')}"
+        # Получаем описание к фото, если есть
+        caption = message.caption or "Опиши что на этом изображении"
 
-                            if url:
-                                await message.answer_photo(url)
+        # Отправляем изображение с текстом на обработку
+        try:
+            # Ответ модели может занять больше 5 секунд, поэтому статус обновляется
+            async with keep_chat_action(message, ChatAction.TYPING):
+                notice, response = await answer_while(
+                    message,
+                    "🖼️ Обрабатываю изображение...",
+                    bothub_request(chat_session_usecase.send_message(user, chat, caption, [file_url]))
+                )
 
-                # Сохраняем обновленные данные
-                await user_repository.update(user)
-                await chat_repository.update(chat)
+            reply = response.get("response") or {}
+            content = reply.get("content", "Извините, не удалось обработать изображение")
+            await send_long_message(message, content, notice)
 
-            except Exception as e:
-                logger.error(f"Error processing photo: {e}", exc_info=True)
-                await message.answer(
-                    "❌ Не удалось обработать изображение. Пожалуйста, попробуйте еще раз.",
-                    parse_mode="Markdown"
-                )
+            # Если в ответе есть сгенерированное изображение, отправляем его
+            attachments = reply.get("attachments") or ()
+            image_urls = [
+                url for attachment in attachments
+                if attachment.get("file", {}).get("type") == "IMAGE"
+                and (url := attachment_image_url(attachment))
+            ]
+            if image_urls:
+                await send_photos(message, image_urls)
 
         except Exception as e:
-            logger.error(f"Error processing photo message: {e}", exc_info=True)
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error processing photo: %s", e)
+            else:
+                logger.exception("Error processing photo: %s", e)
             await message.answer(
-                "❌ Извините, произошла ошибка при обработке фотографии",
-                parse_mode="Markdown"
+                "❌ Не удалось обработать изображение. Пожалуйста, попробуйте еще раз.",
+                parse_mode=None
             )
+        finally:
+            # Сохраняем только изменившиеся данные, в том числе после ошибки запроса к BotHub
+            save_changes(user, chat, state)
 
-    @dp.message(F.document)
+    @dp.message(F.document.mime_type.in_(SUPPORTED_DOCUMENT_MIME_TYPES))
     async def handle_document_message(message: Message):
         """Обработка документов"""
-        try:
-            # Сообщаем пользователю, что бот обрабатывает документ
-            await message.chat.do(ChatAction.UPLOAD_DOCUMENT)
-
-            # Получаем или создаём пользователя и его текущий чат
-            user = await get_or_create_user(message)
-            chat = await get_or_create_chat(user)
-
-            # Получаем документ
-            document = message.document
-            file_id = document.file_id
-            file_name = document.file_name
-            mime_type = document.mime_type
-
-            # Проверяем, что тип файла поддерживается
-            supported_mime_types = [
-                'text/plain', 'text/html', 'text/csv', 'text/markdown',
-                'application/pdf', 'application/json',
-                'image/jpeg', 'image/png', 'image/gif', 'image/webp'
-            ]
-
-            if mime_type not in supported_mime_types:
-                await message.answer(
-                    f"⚠️ Тип файла {mime_type} не поддерживается. Поддерживаемые типы: текстовые файлы, PDF, изображения.",
-                    parse_mode="Markdown"
-                )
-                return
-
-            # Скачиваем файл
-            file = await message.bot.get_file(file_id)
-            file_path = file.file_path
-
-            # Проверяем наличие токена
-            if not message.bot.token:
-                logger.error("Bot token is missing")
-                await message.answer("❌ Ошибка: токен бота отсутствует", parse_mode="Markdown")
-                return
-
-            file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
-
-            # Получаем описание к документу, если есть
-            caption = message.caption or f"Проанализируй содержимое этого файла {file_name}"
+        # Очередь к BotHub переполнена: отвечаем сразу, не нагружая базу и API
+        if bothub_overloaded():
+            await message.answer(OVERLOADED_MESSAGE, parse_mode=None)
+            return
 
-            await message.answer(
-                f"📄 Обрабатываю документ {file_name}...",
-                parse_mode="Markdown"
-            )
+        # Сообщаем пользователю, что бот обрабатывает документ
+        send_chat_action(message, ChatAction.UPLOAD_DOCUMENT)
 
-            # Отправляем документ с текстом на обработку
-            try:
-                await message.chat.do(ChatAction.TYPING)
-                response = await chat_session_usecase.send_message(user, chat, caption, [file_url])
+        # Получаем или создаём пользователя и его текущий чат
+        user = await get_or_create_user(message)
+        chat = await get_or_create_chat(user)
+        await wait_bothub_chat(chat)
+        state = snapshot(user, chat)
+
+        # Получаем документ
+        document = message.document
+        file_id = document.file_id
+        file_name = document.file_name
+
+        # Скачиваем файл
+        file = await message.bot.get_file(file_id)
+        file_path = file.file_path
+
+        # Проверяем наличие токена
+        if not message.bot.token:
+            logger.error("Bot token is missing")
+            await message.answer(MISSING_BOT_TOKEN_MESSAGE, parse_mode=None)
+            return
 
-                content = response.get("response", {}).get("content", "Извините, не удалось обработать документ")
-                await send_long_message(message, content)
+        file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
 
-                # Сохраняем обновленные данные
-                await user_repository.update(user)
-                await chat_repository.update(chat)
+        # Получаем описание к документу, если есть
+        caption = message.caption or f"Проанализируй содержимое этого файла {file_name}"
 
-            except Exception as e:
-                logger.error(f"Error processing document: {e}", exc_info=True)
-                await message.answer(
-                    "❌ Не удалось обработать документ. Пожалуйста, попробуйте еще раз.",
-                    parse_mode="Markdown"
+        # Отправляем документ с текстом на обработку
+        try:
+            # Ответ модели может занять больше 5 секунд, поэтому статус обновляется
+            async with keep_chat_action(message, ChatAction.TYPING):
+                notice, response = await answer_while(
+                    message,
+                    f"📄 Обрабатываю документ {file_name}...",
+                    bothub_request(chat_session_usecase.send_message(user, chat, caption, [file_url]))
                 )
 
+            content = response.get("response", {}).get("content", "Извините, не удалось обработать документ")
+            await send_long_message(message, content, notice)
+
         except Exception as e:
-            logger.error(f"Error processing document message: {e}", exc_info=True)
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error processing document: %s", e)
+            else:
+                logger.exception("Error processing document: %s", e)
             await message.answer(
-                "❌ Извините, произошла ошибка при обработке документа",
-                parse_mode="Markdown"
+                "❌ Не удалось обработать документ. Пожалуйста, попробуйте еще раз.",
+                parse_mode=None
             )
+        finally:
+            # Сохраняем только изменившиеся данные, в том числе после ошибки запроса к BotHub
+            save_changes(user, chat, state)
+
+    @dp.message(F.document)
+    async def handle_unsupported_document(message: Message):
+        """Документы неподдерживаемых типов отклоняются без обращения к базе и BotHub"""
+        await message.answer(
+            f"⚠️ Тип файла {message.document.mime_type} не поддерживается. Поддерживаемые типы: текстовые файлы, PDF, изображения.",
+            parse_mode=None
+        )
 
     # Возвращаем роутер для aiogram
     return dp
\ No newline at end of file
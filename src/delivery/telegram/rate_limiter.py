@@ -0,0 +1,130 @@
+# src/delivery/telegram/rate_limiter.py
+import asyncio
+import logging
+import random
+from typing import Dict
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, SendChatAction, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит Telegram на исходящие сообщения бота (сообщений в секунду)
+GLOBAL_RATE = 30
+
+# Лимит на сообщения в один личный чат (сообщений в секунду)
+PRIVATE_CHAT_RATE = 1
+
+# Лимит на сообщения в одну группу (сообщений в минуту)
+GROUP_CHAT_RATE = 20
+
+# Сколько раз повторяем запрос после ответа 429 от Telegram
+MAX_RETRIES = 3
+
+# Доля случайной добавки к паузе после 429, чтобы чаты, получившие ограничение
+# одновременно, не повторяли запросы одной волной
+RETRY_JITTER = 0.5
+
+# Верхняя граница роста паузы между повторами (секунд), если Telegram не требует большей
+MAX_RETRY_DELAY = 60
+
+# Порог, после которого из словаря удаляются лимиты неактивных чатов
+MAX_TRACKED_CHATS = 10_000
+
+
+class RateBucket:
+    """Ограничитель частоты запросов (GCRA) с допустимой пачкой в capacity запросов"""
+
+    def __init__(self, capacity: int, period: float):
+        self._interval = period / capacity
+        self._tolerance = (capacity - 1) * self._interval
+        self._tat = 0.0
+
+    def is_idle(self, now: float) -> bool:
+        """Проверяет, что лимит полностью восстановился"""
+        return self._tat <= now
+
+    def delay(self, now: float) -> float:
+        """Резервирует слот и возвращает, сколько нужно подождать до отправки"""
+        # Чтение и запись без await между ними, поэтому блокировка не нужна
+        tat = max(self._tat, now)
+        self._tat = tat + self._interval
+        return max(0.0, tat - self._tolerance - now)
+
+    def pause(self, now: float, seconds: float) -> None:
+        """Откладывает следующие запросы после ответа 429 от Telegram"""
+        self._tat = max(self._tat, now + seconds + self._tolerance)
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота, выравнивающая исходящие запросы под лимиты Telegram:
+    общий лимит на бота и отдельный лимит на каждый чат.
+    При ответе 429 ждёт указанное Telegram время и повторяет запрос.
+    """
+
+    def __init__(self):
+        self._global = RateBucket(GLOBAL_RATE, 1)
+        self._chats: Dict[int, RateBucket] = {}
+
+    def _chat_bucket(self, chat_id: int, now: float) -> RateBucket:
+        """Возвращает лимит для чата, создавая его при первом обращении"""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_TRACKED_CHATS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+            # Отрицательный идентификатор - группа или канал
+            if chat_id < 0:
+                bucket = RateBucket(GROUP_CHAT_RATE, 60)
+            else:
+                bucket = RateBucket(PRIVATE_CHAT_RATE, 1)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        # Лимиты касаются только сообщений в чат. Статус набора текста сообщением не считается
+        # и не занимает ни лимит чата, ни общий лимит, чтобы не задерживать настоящие ответы
+        if chat_id is None or isinstance(method, SendChatAction):
+            return await make_request(bot, method)
+
+        chat_bucket = None
+        if isinstance(chat_id, int):
+            chat_bucket = self._chat_bucket(chat_id, asyncio.get_running_loop().time())
+
+        for attempt in range(MAX_RETRIES + 1):
+            # Сначала ждём очереди в чате, чтобы не занимать общий слот впустую
+            if chat_bucket is not None:
+                delay = chat_bucket.delay(asyncio.get_running_loop().time())
+                if delay:
+                    await asyncio.sleep(delay)
+            delay = self._global.delay(asyncio.get_running_loop().time())
+            if delay:
+                await asyncio.sleep(delay)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                # Telegram сам сообщает, сколько ждать; ожидание растёт с каждой попыткой
+                delay = max(e.retry_after, min(MAX_RETRY_DELAY, e.retry_after * (2 ** attempt)))
+                delay *= 1 + random.uniform(0, RETRY_JITTER)
+                logger.warning(
+                    "Telegram rate limit hit for chat %s, retrying in %.1f s (attempt %s)",
+                    chat_id, delay, attempt + 1
+                )
+                # Остальные запросы в этот чат тоже ждут, чтобы не получить 429 повторно
+                now = asyncio.get_running_loop().time()
+                if chat_bucket is not None:
+                    chat_bucket.pause(now, delay)
+                else:
+                    await asyncio.sleep(delay)
@@ -1,12 +1,20 @@
 # Дополнение файла src/domain/service/intent_detection.py
 
 import re
+import asyncio
+from collections import OrderedDict
 from enum import Enum
-from typing import Dict, Tuple, List, Any, Optional, Set
+from typing import Dict, Tuple, List, Any, Optional, Set, Pattern, Match
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Сколько последних результатов определения намерения хранить в памяти
+INTENT_CACHE_SIZE = 128
+
+# С какой длины текст разбирается в отдельном потоке, чтобы не блокировать цикл событий
+THREAD_MIN_TEXT_LENGTH = 1000
+
 
 class IntentType(Enum):
     CHAT = "chat"  # Обычное общение с ботом
@@ -67,12 +75,24 @@ class IntentDetectionService:
             r"\bstable diffusion\b",
         ]
 
+        # Предкомпилированные шаблоны (порядок важен: побеждает первый совпавший)
+        self._web_search_patterns = self._compile_patterns(self.web_search_keywords)
+        self._image_generation_patterns = self._compile_patterns(self.image_generation_keywords)
+
+        # Объединённые выражения для быстрого отсева сообщений без ключевых слов
+        self._web_search_re = self._compile_alternation(self.web_search_keywords)
+        self._image_generation_re = self._compile_alternation(self.image_generation_keywords)
+
         # Контекст предыдущих сообщений и определенных намерений
         self.context = {}
 
         # Набор обнаруженных ключевых слов для логирования и улучшения
         self.detected_keywords = set()
 
+        # Последние результаты для текстов без контекста: без него результат
+        # зависит только от текста, поэтому повторные сообщения не разбираются заново
+        self._cache: OrderedDict = OrderedDict()
+
     def detect_intent(self, text: str, user_id: Optional[str] = None,
                       chat_context: Optional[List[Dict[str, Any]]] = None) -> Tuple[IntentType, Dict[str, Any]]:
         """
@@ -86,6 +106,53 @@ class IntentDetectionService:
         Returns:
             Tuple[IntentType, Dict[str, Any]]: Тип намерения и дополнительные данные
         """
+        # Контекст может изменить результат, поэтому кэшируем только разбор без него
+        if user_id and chat_context:
+            return self._detect_intent(text, user_id, chat_context)
+
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            intent_type, intent_data = cached
+            return intent_type, dict(intent_data)
+
+        intent_type, intent_data = self._detect_intent(text, user_id, chat_context)
+        self._cache_put(text, intent_type, intent_data)
+        return intent_type, dict(intent_data)
+
+    async def detect_intent_async(self, text: str, user_id: Optional[str] = None,
+                                  chat_context: Optional[List[Dict[str, Any]]] = None) -> Tuple[IntentType, Dict[str, Any]]:
+        """
+        Определение намерения без блокировки цикла событий.
+
+        Короткие и уже разобранные тексты обрабатываются сразу, длинные - в отдельном потоке.
+        Кэш изменяется только в потоке цикла событий.
+
+        Args:
+            text: Текст сообщения пользователя
+            user_id: ID пользователя (для контекстного анализа)
+            chat_context: Предыдущие сообщения в чате (для контекстного анализа)
+
+        Returns:
+            Tuple[IntentType, Dict[str, Any]]: Тип намерения и дополнительные данные
+        """
+        if len(text) < THREAD_MIN_TEXT_LENGTH or text in self._cache:
+            return self.detect_intent(text, user_id, chat_context)
+
+        intent_type, intent_data = await asyncio.to_thread(self._detect_intent, text, user_id, chat_context)
+        if not (user_id and chat_context):
+            self._cache_put(text, intent_type, intent_data)
+        return intent_type, dict(intent_data)
+
+    def _cache_put(self, text: str, intent_type: IntentType, intent_data: Dict[str, Any]) -> None:
+        """Сохранение результата в кэш с вытеснением самых старых записей"""
+        self._cache[text] = (intent_type, intent_data)
+        if len(self._cache) > INTENT_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def _detect_intent(self, text: str, user_id: Optional[str],
+                       chat_context: Optional[List[Dict[str, Any]]]) -> Tuple[IntentType, Dict[str, Any]]:
+        """Определение намерения без использования кэша"""
         # Приводим текст к нижнему регистру для удобства анализа
         text_lower = text.lower()
 
@@ -93,30 +160,28 @@ class IntentDetectionService:
         detected_keywords = set()
 
         # Проверяем на намерение поиска в интернете
-        for pattern in self.web_search_keywords:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                # Добавляем найденное ключевое слово для анализа
-                matched = re.search(pattern, text_lower, re.IGNORECASE)
-                detected_keywords.add(matched.group(0))
-
-                # Определяем запрос для поиска
-                search_query = self._extract_search_query(text_lower, pattern)
-                logger.info(f"Detected web search intent with keywords: {detected_keywords}")
-                return IntentType.WEB_SEARCH, {"query": search_query or text,
-                                               "detected_keywords": list(detected_keywords)}
+        matched = self._find_first_match(self._web_search_re, self._web_search_patterns, text_lower)
+        if matched:
+            # Добавляем найденное ключевое слово для анализа
+            detected_keywords.add(matched.group(0))
+
+            # Определяем запрос для поиска
+            search_query = self._extract_search_query(text_lower, matched)
+            logger.debug("Detected web search intent with keywords: %s", detected_keywords)
+            return IntentType.WEB_SEARCH, {"query": search_query or text,
+                                           "detected_keywords": list(detected_keywords)}
 
         # Проверяем на намерение генерации изображений
-        for pattern in self.image_generation_keywords:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                # Добавляем найденное ключевое слово для анализа
-                matched = re.search(pattern, text_lower, re.IGNORECASE)
-                detected_keywords.add(matched.group(0))
-
-                # Определяем запрос для генерации изображения
-                image_prompt = self._extract_image_prompt(text_lower, pattern)
-                logger.info(f"Detected image generation intent with keywords: {detected_keywords}")
-                return IntentType.IMAGE_GENERATION, {"prompt": image_prompt or text,
-                                                     "detected_keywords": list(detected_keywords)}
+        matched = self._find_first_match(self._image_generation_re, self._image_generation_patterns, text_lower)
+        if matched:
+            # Добавляем найденное ключевое слово для анализа
+            detected_keywords.add(matched.group(0))
+
+            # Определяем запрос для генерации изображения
+            image_prompt = self._extract_image_prompt(text_lower, matched)
+            logger.debug("Detected image generation intent with keywords: %s", detected_keywords)
+            return IntentType.IMAGE_GENERATION, {"prompt": image_prompt or text,
+                                                 "detected_keywords": list(detected_keywords)}
 
         # Учитываем контекст предыдущих сообщений, если он предоставлен
         if user_id and chat_context and user_id in self.context:
@@ -125,29 +190,64 @@ class IntentDetectionService:
                 # Если в предыдущем сообщении было определено намерение и новое сообщение 
                 # короткое или похоже на продолжение диалога, сохраняем предыдущее намерение
                 if len(text_lower.split()) <= 5 or text_lower.startswith(('да', 'нет', 'конечно', 'yes', 'no', 'sure')):
-                    logger.info(f"Continuing previous intent: {previous_intent}")
+                    logger.debug("Continuing previous intent: %s", previous_intent)
                     if previous_intent == IntentType.WEB_SEARCH:
                         return IntentType.WEB_SEARCH, {"query": text, "context_continuation": True}
                     elif previous_intent == IntentType.IMAGE_GENERATION:
                         return IntentType.IMAGE_GENERATION, {"prompt": text, "context_continuation": True}
 
         # Если не определено специфическое намерение, считаем что это обычный чат
-        logger.info("No specific intent detected, defaulting to chat")
+        logger.debug("No specific intent detected, defaulting to chat")
         return IntentType.CHAT, {"message": text}
 
-    def _extract_search_query(self, text: str, pattern: str) -> Optional[str]:
+    @staticmethod
+    def _compile_patterns(patterns: List[str]) -> List[Pattern[str]]:
+        """Компиляция списка шаблонов ключевых слов"""
+        return [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+    @staticmethod
+    def _compile_alternation(patterns: List[str]) -> Pattern[str]:
+        """Компиляция списка шаблонов в одно регулярное выражение"""
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+    @staticmethod
+    def _find_first_match(combined: Pattern[str], patterns: List[Pattern[str]], text: str) -> Optional[Match[str]]:
+        """
+        Поиск совпадения с первым подходящим шаблоном из списка.
+
+        Объединённое выражение отсеивает сообщения без ключевых слов за один проход,
+        перебор отдельных шаблонов выполняется только при наличии совпадения.
+
+        Args:
+            combined: Объединённое выражение всех шаблонов
+            patterns: Скомпилированные шаблоны в порядке приоритета
+            text: Текст сообщения
+
+        Returns:
+            Optional[Match[str]]: Совпадение первого подходящего шаблона или None
+        """
+        if not combined.search(text):
+            return None
+
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match:
+                return match
+
+        return None
+
+    def _extract_search_query(self, text: str, match: Match[str]) -> Optional[str]:
         """
         Извлечение поискового запроса из текста сообщения.
         Пример: "найди информацию о Пушкине" -> "Пушкин"
 
         Args:
             text: Текст сообщения
-            pattern: Шаблон, который соответствует поисковому намерению
+            match: Совпадение шаблона поискового намерения
 
         Returns:
             Optional[str]: Извлеченный поисковый запрос или None
         """
-        match = re.search(pattern, text, re.IGNORECASE)
         if not match:
             return None
 
@@ -162,19 +262,18 @@ class IntentDetectionService:
         # Иначе возвращаем весь текст
         return text
 
-    def _extract_image_prompt(self, text: str, pattern: str) -> Optional[str]:
+    def _extract_image_prompt(self, text: str, match: Match[str]) -> Optional[str]:
         """
         Извлечение промпта для генерации изображения из текста сообщения.
         Пример: "нарисуй красивый закат над морем" -> "красивый закат над морем"
 
         Args:
             text: Текст сообщения
-            pattern: Шаблон, который соответствует намерению генерации изображения
+            match: Совпадение шаблона намерения генерации изображения
 
         Returns:
             Optional[str]: Извлеченный промпт или None
         """
-        match = re.search(pattern, text, re.IGNORECASE)
         if not match:
             return None
 
@@ -187,7 +286,7 @@ class IntentDetectionService:
             return prompt
 
         # Иначе возвращаем весь текст без ключевого слова
-        return re.sub(pattern, '', text, flags=re.IGNORECASE).strip()
+        return match.re.sub('', text).strip()
 
     def update_user_context(self, user_id: str, intent_type: IntentType, intent_data: Dict[str, Any]) -> None:
         """
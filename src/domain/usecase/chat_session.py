@@ -1,6 +1,7 @@
 from src.domain.entity.user import User
 from src.domain.entity.chat import Chat
 from src.adapter.gateway.bothub_gateway import BothubGateway
+from src.lib.clients.bothub_client import EXPECTED_ERRORS
 from typing import Dict, Any, List, Optional
 import logging
 
@@ -27,9 +28,20 @@ class ChatSessionUseCase:
         Returns:
             Dict[str, Any]: Ответ от BotHub API
         """
-        logger.info(f"Sending message to chat {chat.bothub_chat_id} for user {user.id}")
+        logger.info("Sending message to chat %s for user %s", chat.bothub_chat_id, user.id)
         return await self.gateway.send_message(user, chat, message, files)
 
+    async def create_new_chat(self, user: User, chat: Chat) -> None:
+        """
+        Создание чата в BotHub
+
+        Args:
+            user: Пользователь
+            chat: Чат
+        """
+        logger.info("Creating BotHub chat for user %s", user.id)
+        await self.gateway.create_new_chat(user, chat)
+
     async def send_buffer(self, user: User, chat: Chat) -> Dict[str, Any]:
         """
         Отправка буфера сообщений
@@ -41,7 +53,7 @@ class ChatSessionUseCase:
         Returns:
             Dict[str, Any]: Ответ от BotHub API
         """
-        logger.info(f"Sending buffer to chat {chat.bothub_chat_id} for user {user.id}")
+        logger.info("Sending buffer to chat %s for user %s", chat.bothub_chat_id, user.id)
         return await self.gateway.send_buffer(user, chat)
 
     async def reset_context(self, user: User, chat: Chat) -> None:
@@ -52,7 +64,7 @@ class ChatSessionUseCase:
             user: Пользователь
             chat: Чат
         """
-        logger.info(f"Resetting context for chat {chat.bothub_chat_id} for user {user.id}")
+        logger.info("Resetting context for chat %s for user %s", chat.bothub_chat_id, user.id)
         await self.gateway.reset_context(user, chat)
 
     async def save_system_prompt(self, user: User, chat: Chat) -> None:
@@ -63,10 +75,10 @@ class ChatSessionUseCase:
             user: Пользователь
             chat: Чат
         """
-        logger.info(f"Saving system prompt for chat {chat.bothub_chat_id} for user {user.id}")
+        logger.info("Saving system prompt for chat %s for user %s", chat.bothub_chat_id, user.id)
         await self.gateway.save_chat_settings(user, chat)
 
-    async def transcribe_voice(self, user: User, chat: Chat, file_url: str) -> str:
+    async def transcribe_voice(self, user: User, chat: Chat, file_url: str, file_path: Optional[str] = None) -> str:
         """
         Транскрибирование голосового сообщения
 
@@ -74,16 +86,20 @@ class ChatSessionUseCase:
             user: Пользователь
             chat: Чат
             file_url: URL файла голосового сообщения
+            file_path: Путь к файлу на диске локального Telegram Bot API
 
         Returns:
             str: Текст голосового сообщения
         """
-        logger.info(f"Transcribing voice message for user {user.id}")
+        logger.info("Transcribing voice message for user %s", user.id)
 
         try:
             # Реализация через BotHub API
-            return await self.gateway.transcribe_voice(user, chat, file_url)
+            return await self.gateway.transcribe_voice(user, chat, file_url, file_path)
         except Exception as e:
-            logger.error(f"Error in voice transcription: {e}", exc_info=True)
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error in voice transcription: %s", e)
+            else:
+                logger.exception("Error in voice transcription: %s", e)
             # Временное решение - возвращаем текст заглушки
             return "Это текст голосового сообщения (заглушка)"
\ No newline at end of file
@@ -6,6 +6,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Модели, которые генерируют изображения в текущем чате без переключения
+IMAGE_GENERATION_MODELS = frozenset({"dall-e", "midjourney", "stability", "kandinsky", "flux"})
+
 
 class ImageGenerationUseCase:
     """Юзкейс для работы с генерацией изображений"""
@@ -27,11 +30,12 @@ class ImageGenerationUseCase:
         Returns:
             Dict[str, Any]: Ответ от BotHub API с сгенерированными изображениями
         """
-        logger.info(f"Generating image for prompt: {prompt} for user {user.id}")
+        logger.info("Generating image for user %s, prompt length: %d", user.id, len(prompt))
+        logger.debug("Image prompt: %s", prompt)
 
         # Создаем новый чат для генерации изображений, если текущий чат не для изображений
         current_model = chat.bothub_chat_model
-        is_image_generation_model = current_model in ["dall-e", "midjourney", "stability", "kandinsky", "flux"]
+        is_image_generation_model = current_model in IMAGE_GENERATION_MODELS
 
         if not is_image_generation_model:
             # Сохраняем текущую модель
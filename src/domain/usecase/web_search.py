@@ -1,6 +1,7 @@
 from src.domain.entity.user import User
 from src.domain.entity.chat import Chat
 from src.adapter.gateway.bothub_gateway import BothubGateway
+from src.lib.clients.bothub_client import EXPECTED_ERRORS
 from typing import Dict, Any, List, Optional
 import logging
 
@@ -26,16 +27,20 @@ class WebSearchUseCase:
         Returns:
             Dict[str, Any]: Ответ от BotHub API с результатами поиска
         """
-        logger.info(f"Searching web for query: {query} for user {user.id}")
+        logger.info("Searching web for user %s, query length: %d", user.id, len(query))
+        logger.debug("Search query: %s", query)
 
         # Включаем веб-поиск для чата, если он не включен
         try:
             web_search_enabled = await self.gateway.get_web_search(user, chat)
             if not web_search_enabled:
                 await self.gateway.enable_web_search(user, chat, True)
-                logger.info(f"Web search enabled for chat {chat.bothub_chat_id}")
+                logger.info("Web search enabled for chat %s", chat.bothub_chat_id)
         except Exception as e:
-            logger.error(f"Error enabling web search: {e}", exc_info=True)
+            if isinstance(e, EXPECTED_ERRORS):
+                logger.warning("Error enabling web search: %s", e)
+            else:
+                logger.exception("Error enabling web search: %s", e)
 
         # Формируем запрос с явным указанием на поиск
         search_query = f"web search: {query}"
@@ -51,5 +56,5 @@ class WebSearchUseCase:
             chat: Чат
             enabled: Включен ли веб-поиск
         """
-        logger.info(f"Toggling web search to {enabled} for chat {chat.bothub_chat_id}")
+        logger.info("Toggling web search to %s for chat %s", enabled, chat.bothub_chat_id)
         await self.gateway.enable_web_search(user, chat, enabled)
\ No newline at end of file
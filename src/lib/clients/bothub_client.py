@@ -1,5 +1,6 @@
 # Дополнение файла src/lib/clients/bothub_client.py
 
+import asyncio
 import aiohttp
 import json
 import logging
@@ -8,13 +9,46 @@ from src.config.settings import Settings
 
 logger = logging.getLogger(__name__)
 
+
+class BothubApiError(Exception):
+    """Ошибка, которую вернул BotHub API (код ответа 4xx/5xx)"""
+
+
+# Ожидаемые ошибки при обращении к BotHub: сеть, таймаут, ответ API с ошибкой.
+# Для них достаточно текста ошибки, трассировка в логе не нужна
+EXPECTED_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, BothubApiError)
+
+
 class BothubClient:
     """Клиент для взаимодействия с BotHub API"""
 
     def __init__(self, settings: Settings):
+        self.settings = settings
         self.api_url = settings.BOTHUB_API_URL
         self.secret_key = settings.BOTHUB_SECRET_KEY
         self.request_query = "?request_from=telegram&platform=TELEGRAM"
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP-сессию, создавая её при первом обращении"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.settings.HTTP_POOL_LIMIT,
+                    limit_per_host=self.settings.HTTP_POOL_LIMIT_PER_HOST,
+                    ttl_dns_cache=self.settings.HTTP_DNS_CACHE_TTL,
+                    use_dns_cache=True,
+                    keepalive_timeout=self.settings.HTTP_KEEPALIVE_TIMEOUT,
+                    enable_cleanup_closed=True
+                )
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Закрывает HTTP-сессию клиента"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def _make_request(
             self,
@@ -30,49 +64,49 @@ class BothubClient:
         default_headers = {"Content-type": "application/json"} if as_json else {}
         headers = {**default_headers, **(headers or {})}
 
-        async with aiohttp.ClientSession() as session:
-            if method == "GET":
-                async with session.get(url, headers=headers, timeout=timeout) as response:
-                    if response.status >= 400:
-                        error_text = await response.text()
-                        raise Exception(f"Error {response.status}: {error_text}")
-                    return await response.json()
-            elif method == "POST":
-                async with session.post(
-                        url,
-                        headers=headers,
-                        json=data if as_json else None,
-                        data=data if not as_json else None,
-                        timeout=timeout
-                ) as response:
-                    if response.status >= 400:
-                        error_text = await response.text()
-                        raise Exception(f"Error {response.status}: {error_text}")
-                    return await response.json()
-            elif method == "PATCH":
-                async with session.patch(
-                        url,
-                        headers=headers,
-                        json=data if as_json else None,
-                        timeout=timeout
-                ) as response:
-                    if response.status >= 400:
-                        error_text = await response.text()
-                        raise Exception(f"Error {response.status}: {error_text}")
-                    return await response.json()
-            elif method == "PUT":
-                async with session.put(
-                        url,
-                        headers=headers,
-                        json=data if as_json else None,
-                        timeout=timeout
-                ) as response:
-                    if response.status >= 400:
-                        error_text = await response.text()
-                        raise Exception(f"Error {response.status}: {error_text}")
-                    return await response.json()
-            else:
-                raise ValueError(f"Unsupported method: {method}")
+        session = self._get_session()
+        if method == "GET":
+            async with session.get(url, headers=headers, timeout=timeout) as response:
+                if response.status >= 400:
+                    error_text = await response.text()
+                    raise BothubApiError(f"Error {response.status}: {error_text}")
+                return await response.json()
+        elif method == "POST":
+            async with session.post(
+                    url,
+                    headers=headers,
+                    json=data if as_json else None,
+                    data=data if not as_json else None,
+                    timeout=timeout
+            ) as response:
+                if response.status >= 400:
+                    error_text = await response.text()
+                    raise BothubApiError(f"Error {response.status}: {error_text}")
+                return await response.json()
+        elif method == "PATCH":
+            async with session.patch(
+                    url,
+                    headers=headers,
+                    json=data if as_json else None,
+                    timeout=timeout
+            ) as response:
+                if response.status >= 400:
+                    error_text = await response.text()
+                    raise BothubApiError(f"Error {response.status}: {error_text}")
+                return await response.json()
+        elif method == "PUT":
+            async with session.put(
+                    url,
+                    headers=headers,
+                    json=data if as_json else None,
+                    timeout=timeout
+            ) as response:
+                if response.status >= 400:
+                    error_text = await response.text()
+                    raise BothubApiError(f"Error {response.status}: {error_text}")
+                return await response.json()
+        else:
+            raise ValueError(f"Unsupported method: {method}")
 
     async def authorize(
             self,
@@ -96,10 +130,10 @@ class BothubClient:
             return await self._make_request("v2/auth/telegram", "POST", headers, data)
         except Exception as e:
             # Добавим логирование для отладки
-            logger.error(f"Authorization error: {str(e)}")
-            logger.error(f"Request data: {data}")
-            logger.error(f"Headers: {headers}")
-            raise Exception(f"BotHub авторизация не удалась. Проверьте BOTHUB_SECRET_KEY. Ошибка: {str(e)}")
+            logger.error("Authorization error: %s", str(e))
+            logger.error("Request data: %s", data)
+            logger.error("Headers: %s", headers)
+            raise BothubApiError(f"BotHub авторизация не удалась. Проверьте BOTHUB_SECRET_KEY. Ошибка: {str(e)}") from e
 
     async def get_user_info(self, access_token: str) -> Dict[str, Any]:
         """Получение информации о пользователе"""
@@ -114,7 +148,7 @@ class BothubClient:
         if model_id:
             data["modelId"] = model_id
 
-        logger.info(f"Creating chat with data: {data}")
+        logger.info("Creating chat with data: %s", data)
 
         headers = {"Authorization": f"Bearer {access_token}"}
         return await self._make_request("v2/chat", "POST", headers, data)
@@ -162,7 +196,9 @@ class BothubClient:
         """Получение списка доступных моделей"""
         headers = {"Authorization": f"Bearer {access_token}"}
         models = await self._make_request("v2/model/list", "GET", headers)
-        logger.info(f"Available models: {[model.get('id') for model in models]}")
+        # Список идентификаторов собираем, только если сообщение попадёт в лог
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Available models: %s", [model.get('id') for model in models])
         return models
 
     async def create_new_group(self, access_token: str, name: str) -> Dict[str, Any]:
@@ -212,13 +248,14 @@ class BothubClient:
         data = {"modelId": model_id}
         return await self._make_request(f"v2/chat/{chat_id}", "PATCH", headers, data)
 
-    async def transcribe(self, access_token: str, file_path: str) -> dict:
+    async def transcribe(self, access_token: str, file_data: bytes, filename: str) -> dict:
         """
         Транскрибирует аудиофайл с помощью API Whisper
 
         Args:
             access_token: Токен доступа
-            file_path: Путь к аудиофайлу
+            file_data: Содержимое аудиофайла
+            filename: Имя аудиофайла
 
         Returns:
             dict: Результат транскрибирования
@@ -227,25 +264,23 @@ class BothubClient:
             "Authorization": f"Bearer {access_token}"
         }
 
-        async with aiohttp.ClientSession() as session:
-            with open(file_path, "rb") as audio_file:
-                form_data = aiohttp.FormData()
-                form_data.add_field(
-                    name="file",
-                    value=audio_file,
-                    filename=os.path.basename(file_path),
-                    content_type="audio/ogg"
-                )
-                form_data.add_field("model", "whisper-1")
-
-                async with session.post(
-                        f"{self.api_url}/api/v2/openai/v1/audio/transcriptions{self.request_query}",
-                        headers=headers,
-                        data=form_data
-                ) as response:
-                    if response.status >= 400:
-                        text = await response.text()
-                        # Используем обычное исключение вместо WhisperException
-                        raise Exception(f"Error {response.status}: {text}")
-
-                    return await response.json()
\ No newline at end of file
+        session = self._get_session()
+        form_data = aiohttp.FormData()
+        form_data.add_field(
+            name="file",
+            value=file_data,
+            filename=filename,
+            content_type="audio/ogg"
+        )
+        form_data.add_field("model", "whisper-1")
+
+        async with session.post(
+                f"{self.api_url}/api/v2/openai/v1/audio/transcriptions{self.request_query}",
+                headers=headers,
+                data=form_data
+        ) as response:
+            if response.status >= 400:
+                text = await response.text()
+                raise BothubApiError(f"Error {response.status}: {text}")
+
+            return await response.json()
@@ -1,32 +1,136 @@
 import os
-import time
+import asyncio
 import aiohttp
-import tempfile
-from typing import Optional
+from typing import Optional, Union
 
+# Размер блока при чтении ответа по HTTP
+CHUNK_SIZE = 64 * 1024
 
-async def download_file(url: str, filename: Optional[str] = None) -> str:
+# Максимальный размер скачиваемого файла (лимит Telegram Bot API на скачивание)
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+
+# Ограничение времени на скачивание одного файла
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# Общая HTTP-сессия для скачивания файлов, создаётся при первом обращении
+_session: Optional[aiohttp.ClientSession] = None
+
+# Параметры пула соединений сессии, переопределяются через configure_session
+_connector_options = {
+    "limit": 128,
+    "limit_per_host": 32,
+    "ttl_dns_cache": 600,
+    "keepalive_timeout": 75.0,
+}
+
+
+def configure_session(limit: int, limit_per_host: int, ttl_dns_cache: int, keepalive_timeout: float) -> None:
+    """Задаёт параметры пула соединений; применяются при создании сессии"""
+    _connector_options.update(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=ttl_dns_cache,
+        keepalive_timeout=keepalive_timeout
+    )
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP-сессию для скачивания файлов"""
+    global _session
+    if _session is None or _session.closed:
+        # Сессия общая для всех пользователей, поэтому куки ответов не сохраняются
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                use_dns_cache=True,
+                enable_cleanup_closed=True,
+                **_connector_options
+            ),
+            timeout=DOWNLOAD_TIMEOUT,
+            cookie_jar=aiohttp.DummyCookieJar()
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Закрывает общую HTTP-сессию для скачивания файлов"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def _check_size(response: aiohttp.ClientResponse) -> None:
+    """Отклоняет слишком большой файл по Content-Length, не начиная скачивание"""
+    if response.content_length and response.content_length > MAX_DOWNLOAD_SIZE:
+        raise Exception(f"File is too large: {response.content_length} bytes")
+
+
+async def _read_body(response: aiohttp.ClientResponse) -> bytearray:
+    """Читает тело ответа в буфер, заранее выделенный по Content-Length"""
+    # Слишком большой файл отклоняем до того, как выделить под него буфер
+    _check_size(response)
+    buffer = bytearray(response.content_length or 0)
+    position = 0
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        if position + len(chunk) > MAX_DOWNLOAD_SIZE:
+            raise Exception(f"File is larger than {MAX_DOWNLOAD_SIZE} bytes")
+
+        # Внутри выделенного буфера запись идёт на место, без перевыделения памяти
+        buffer[position:position + len(chunk)] = chunk
+        position += len(chunk)
+
+    # Сервер мог прислать меньше данных, чем указал в Content-Length
+    del buffer[position:]
+    return buffer
+
+
+async def _download_http_bytes(url: str) -> bytearray:
+    """Скачивает файл по HTTP в память"""
+    async with get_session().get(url) as response:
+        if response.status == 200:
+            return await _read_body(response)
+        else:
+            raise Exception(f"Failed to download file: {response.status}")
+
+
+def _read_file(file_path: str) -> bytes:
+    """Читает файл целиком, отклоняя слишком большой без чтения"""
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > MAX_DOWNLOAD_SIZE:
+            raise Exception(f"File is too large: {size} bytes")
+        return f.read()
+
+
+async def download_bytes(url: str, local_path: Optional[str] = None) -> Union[bytes, bytearray]:
     """
-    Скачивает файл по URL
+    Скачивает файл по URL в память, не создавая временных файлов
 
     Args:
         url: URL файла
-        filename: Имя файла (если None, будет сгенерировано случайное имя)
+        local_path: Путь к файлу на диске локального Telegram Bot API (если доступен)
 
     Returns:
-        str: Путь к скачанному файлу
+        bytes | bytearray: Содержимое файла; буфер HTTP-загрузки возвращается без копирования
     """
-    if not filename:
-        filename = f"tmp_{int(time.time())}"
-
-    temp_dir = tempfile.gettempdir()
-    file_path = os.path.join(temp_dir, filename)
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                with open(file_path, "wb") as f:
-                    f.write(await response.read())
-                return file_path
-            else:
-                raise Exception(f"Failed to download file: {response.status}")
\ No newline at end of file
+    if not local_path:
+        return await _download_http_bytes(url)
+
+    # Одновременно читаем локальный файл и скачиваем его по HTTP,
+    # берём результат первой успешной попытки
+    local_task = asyncio.create_task(asyncio.to_thread(_read_file, local_path))
+    http_task = asyncio.create_task(_download_http_bytes(url))
+
+    pending = {local_task, http_task}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+
+        # Обе попытки завершились ошибкой - пробрасываем ошибку HTTP
+        raise http_task.exception()
+    finally:
+        for task in pending:
+            task.cancel()